@@ -0,0 +1,74 @@
+"""Per-request cost of the pairing endpoints with and without the WSGI fast path.
+
+Each request is dispatched straight into the WSGI callable (no sockets), so
+the numbers are the framework overhead plus the pairing-store call.
+
+    python benchmarks/fast_path.py --requests 20000
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+os.environ.setdefault('PAIRING_BACKEND', 'memory')
+os.environ.setdefault('PAIRING_FAST_PATH', '1')
+# Room for every submitted answer, so submit_direction never hits the 429 path
+os.environ.setdefault('PAIRING_QUEUE_SIZE', '1000000')
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from werkzeug.test import EnvironBuilder  # noqa: E402
+
+import main as vision_app  # noqa: E402
+from fast_path import PairingFastPath  # noqa: E402
+
+
+TOKEN = 'benchtoken'
+REQUESTS = {
+    'mark_ready': dict(path=f'/mark_ready/{TOKEN}', method='POST'),
+    'check_ready': dict(path=f'/check_ready/{TOKEN}'),
+    'submit_direction': dict(
+        path='/submit_direction', method='POST',
+        data=json.dumps({'token': TOKEN, 'direction': 'up'}), content_type='application/json'
+    ),
+    'get_direction': dict(path='/get_direction', query_string={'token': TOKEN}),
+    'check_finished': dict(path=f'/check_finished/{TOKEN}'),
+    'pairing_state': dict(path=f'/pairing/{TOKEN}/state', query_string={'consume': 8}),
+}
+
+
+def start_response(status, headers, exc_info=None):
+    pass
+
+
+def measure(wsgi_app, spec, count):
+    environs = [EnvironBuilder(**spec).get_environ() for _ in range(count)]
+    began = time.perf_counter()
+    for environ in environs:
+        for _ in wsgi_app(environ, start_response):
+            pass
+    return (time.perf_counter() - began) / count * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=20000)
+    args = parser.parse_args()
+
+    # Skip any outer middleware (metrics) so only the dispatch cost differs
+    fast = vision_app.app.wsgi_app
+    while not isinstance(fast, PairingFastPath):
+        if not hasattr(fast, 'app'):
+            sys.exit('PAIRING_FAST_PATH is disabled')
+        fast = fast.app
+    flask_app = fast.app
+
+    print(f'{"endpoint":<18} {"flask us/req":>13} {"fast us/req":>12} {"speedup":>8}')
+    for name, spec in REQUESTS.items():
+        slow = measure(flask_app, spec, args.requests)
+        quick = measure(fast, spec, args.requests)
+        print(f'{name:<18} {slow:>13.1f} {quick:>12.1f} {slow / quick:>7.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,240 @@
+"""Fill the result tables with synthetic history and time the app's queries as it grows.
+
+At every size step the script bulk-inserts users, results and summaries
+until vision_test_result holds that many rows. It then times the queries
+behind /dashboard, /my_results (first page and a deep keyset page) and the
+/start-test UUID lookup. Each query's EXPLAIN QUERY PLAN is checked too, so
+a full-table scan, a temp B-tree sort or a missing index makes the script
+exit non-zero.
+
+    python benchmarks/history_scaling.py --sizes 10000,100000,1000000
+    python benchmarks/history_scaling.py --database /tmp/history.db --sizes 5000000
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+
+
+HISTORY_INDEX = 'ix_vision_test_result_user_timestamp'
+# Substrings every plan of a query must contain, per table touched
+EXPECTED_PLANS = {
+    'dashboard': ('user_result_summary USING INTEGER PRIMARY KEY', f'USING INDEX {HISTORY_INDEX}'),
+    'my_results': ('user_result_summary USING INTEGER PRIMARY KEY', f'USING INDEX {HISTORY_INDEX}'),
+    'my_results_deep': (f'USING INDEX {HISTORY_INDEX}',),
+    'start_test_token': ('USING INDEX sqlite_autoindex_user_',),
+}
+FORBIDDEN_PLANS = ('USE TEMP B-TREE',)
+
+
+# ==================== DATA GENERATION ====================
+def generate(app_module, target_rows, args, state):
+    db = app_module.db
+    users = app_module.User.__table__
+    results = app_module.VisionTestResult.__table__
+    summaries = app_module.UserResultSummary.__table__
+    epoch = datetime(2020, 1, 1)
+
+    while state['rows'] < target_rows:
+        user_rows, result_rows, summary_rows = [], [], []
+        while len(result_rows) < args.batch and state['rows'] + len(result_rows) < target_rows:
+            state['users'] += 1
+            user_id = state['users']
+            user_uuid = str(uuid.uuid4())
+            user_rows.append({
+                'id': user_id,
+                'email': f'user{user_id}@example.test',
+                'password_hash': args.password_hash,
+                'user_uuid': user_uuid,
+                'first_name': 'Synthetic',
+                'last_name': f'User{user_id}',
+                'date_of_birth': '1990-01-01',
+            })
+            heavy = user_id <= args.heavy_users
+            count = args.heavy_tests if heavy else random.randint(1, 2 * args.tests_per_user - 1)
+            count = min(count, target_rows - state['rows'] - len(result_rows)) or 1
+            moment = epoch + timedelta(minutes=random.randint(0, 60 * 24 * 365))
+            for _ in range(count):
+                moment += timedelta(minutes=random.randint(30, 60 * 24 * 30))
+                right, left = random.randint(0, 8), random.randint(0, 8)
+                result_rows.append({
+                    'user_id': user_id, 'right_eye_score': right,
+                    'left_eye_score': left, 'timestamp': moment,
+                })
+            summary_rows.append({
+                'user_id': user_id,
+                'latest_right_eye_score': right,
+                'latest_left_eye_score': left,
+                'recommendation_tier': app_module.recommendation_tier(right, left),
+                'test_count': count,
+                'first_timestamp': result_rows[-count]['timestamp'],
+                'last_timestamp': moment,
+                'result_version': count,
+            })
+            state['uuids'].append((user_id, user_uuid))
+            if heavy:
+                state['heavy'].append(user_id)
+        db.session.execute(users.insert(), user_rows)
+        db.session.execute(results.insert(), result_rows)
+        db.session.execute(summaries.insert(), summary_rows)
+        db.session.commit()
+        state['rows'] += len(result_rows)
+
+
+# ==================== QUERIES ====================
+def build_queries(app_module, state):
+    db = app_module.db
+    summary = app_module.UserResultSummary
+    page_size = app_module.app.config['RESULTS_PAGE_SIZE']
+    dashboard_size = app_module.app.config['DASHBOARD_PAGE_SIZE']
+
+    def dashboard(user_id, user_uuid):
+        db.session.get(summary, user_id)
+        app_module.result_page(user_id, None, dashboard_size)
+
+    def my_results(user_id, user_uuid):
+        db.session.query(summary.result_version, summary.last_timestamp).filter_by(user_id=user_id).first()
+        app_module.result_page(user_id, None, page_size)
+
+    def my_results_deep(user_id, user_uuid):
+        # Halfway into one of the heavy histories
+        heavy_id, cursor = state['deep_cursors'][user_id % len(state['deep_cursors'])]
+        app_module.result_page(heavy_id, cursor, page_size)
+
+    def start_test_token(user_id, user_uuid):
+        app_module.identity_cache.clear()
+        app_module.load_identity('uuid', user_uuid)
+
+    return {
+        'dashboard': dashboard,
+        'my_results': my_results,
+        'my_results_deep': my_results_deep,
+        'start_test_token': start_test_token,
+    }
+
+
+def deep_cursors(app_module, state):
+    cursors = []
+    for user_id in state['heavy']:
+        rows = app_module.VisionTestResult.query.filter_by(user_id=user_id).order_by(
+            app_module.VisionTestResult.timestamp.desc(), app_module.VisionTestResult.id.desc()
+        ).offset(app_module.app.config['RESULTS_PAGE_SIZE'] * 10).limit(1).all()
+        if rows:
+            cursors.append((user_id, (rows[0].timestamp, rows[0].id)))
+    return cursors
+
+
+def capture_statements(app_module, query, sample):
+    from sqlalchemy import event
+
+    captured = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        captured.append((statement, parameters))
+
+    engine = app_module.db.engine
+    event.listen(engine, 'before_cursor_execute', record)
+    try:
+        query(*sample)
+    finally:
+        event.remove(engine, 'before_cursor_execute', record)
+    return captured
+
+
+def check_plan(app_module, name, statements):
+    connection = app_module.db.session.connection()
+    details = []
+    for statement, parameters in statements:
+        rows = connection.exec_driver_sql(f'EXPLAIN QUERY PLAN {statement}', parameters).fetchall()
+        details += [row[-1] for row in rows]
+    failures = [f'forbidden "{bad}" in: {line}' for line in details for bad in FORBIDDEN_PLANS if bad in line]
+    failures += [
+        f'full scan: {line}' for line in details
+        if line.startswith('SCAN ') and 'USING' not in line
+    ]
+    failures += [
+        f'missing "{want}"' for want in EXPECTED_PLANS[name]
+        if not any(want in line for line in details)
+    ]
+    return details, failures
+
+
+def percentile(values, pct):
+    return statistics.quantiles(values, n=100)[pct - 1] if len(values) > 1 else values[0]
+
+
+def benchmark(app_module, state, args):
+    state['deep_cursors'] = deep_cursors(app_module, state)
+    queries = build_queries(app_module, state)
+    if not state['deep_cursors']:
+        del queries['my_results_deep']
+    failed = False
+    for name, query in queries.items():
+        sample = random.choice(state['uuids'])
+        details, failures = check_plan(app_module, name, capture_statements(app_module, query, sample))
+        timings = []
+        for _ in range(args.iterations):
+            user_id, user_uuid = random.choice(state['uuids'])
+            app_module.db.session.expunge_all()
+            started = time.perf_counter()
+            query(user_id, user_uuid)
+            timings.append(time.perf_counter() - started)
+        print(
+            f'{state["rows"]:>10} {name:<18} {statistics.mean(timings) * 1e6:>9.0f}'
+            f' {percentile(timings, 50) * 1e6:>9.0f} {percentile(timings, 99) * 1e6:>9.0f}'
+            f'  {"ok" if not failures else "PLAN FAIL"}'
+        )
+        if failures:
+            failed = True
+            for line in failures:
+                print(f'           {line}')
+            for line in details:
+                print(f'           plan: {line}')
+    return failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', default='10000,100000,1000000', help='result-row counts to reach, in order')
+    parser.add_argument('--tests-per-user', type=int, default=20, help='average results per ordinary user')
+    parser.add_argument('--heavy-users', type=int, default=10, help='users with a long history for deep paging')
+    parser.add_argument('--heavy-tests', type=int, default=5000)
+    parser.add_argument('--batch', type=int, default=50000, help='result rows per bulk insert')
+    parser.add_argument('--iterations', type=int, default=500)
+    parser.add_argument('--database', help='new SQLite file to fill (must not exist yet); defaults to a temporary file')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    random.seed(args.seed)
+
+    path = args.database or os.path.join(tempfile.mkdtemp(), 'history.db')
+    if os.path.exists(path):
+        sys.exit(f'{path} already exists; pick a new --database file')
+    os.environ['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{os.path.abspath(path)}'
+    os.environ.setdefault('SQL_SLOW_QUERY_MS', '60000')
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+    import main as vision_app
+    from werkzeug.security import generate_password_hash
+
+    # One real hash shared by every synthetic user; hashing millions is not the point
+    args.password_hash = generate_password_hash('synthetic', 'pbkdf2:sha256:1000')
+    state = {'rows': 0, 'users': 0, 'uuids': [], 'heavy': []}
+    failed = False
+    with vision_app.app.app_context():
+        vision_app.upgrade_db()
+        print(f'{"rows":>10} {"query":<18} {"mean us":>9} {"p50 us":>9} {"p99 us":>9}  plan')
+        for size in (int(s) for s in args.sizes.split(',')):
+            started = time.perf_counter()
+            generate(vision_app, size, args, state)
+            print(f'{state["rows"]:>10} rows, {state["users"]} users loaded in {time.perf_counter() - started:.1f}s')
+            failed = benchmark(vision_app, state, args) or failed
+    print(f'database: {path}')
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,249 @@
+"""End-to-end load test of N concurrent dual-device vision tests.
+
+Every simulated session signs up a user and opens the dashboard to get a
+pairing code. Four roles then run concurrently:
+
+- laptop: polls /check_ready until the phone checks in
+- phone: calls /mark_ready
+- display: polls /get_direction for answers
+- controller: posts answers to /submit_direction
+
+The session ends with /submit_score. By default the app runs in-process
+behind the Flask test client on a throwaway database; pass --url to drive
+a running server instead.
+
+    python benchmarks/pairing_load.py --sessions 200 --directions 10
+    python benchmarks/pairing_load.py --url http://127.0.0.1:5050 --server-pid 1234
+"""
+import argparse
+import http.cookiejar
+import json
+import os
+import re
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from collections import defaultdict
+
+
+TOKEN_PATTERN = re.compile(r'let token = "([^"]+)"')
+DIRECTIONS = ('up', 'down', 'left', 'right')
+
+
+# ==================== TRANSPORTS ====================
+class TestClientTransport:
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def request(self, method, path, payload=None):
+        response = self.client.open(path, method=method, json=payload)
+        return response.status_code, response.get_data()
+
+
+class HTTPTransport:
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar())
+        )
+
+    def request(self, method, path, payload=None):
+        data = json.dumps(payload).encode() if payload is not None else None
+        req = urllib.request.Request(self.base_url + path, data=data, method=method)
+        if data is not None:
+            req.add_header('Content-Type', 'application/json')
+        try:
+            with self.opener.open(req, timeout=60) as response:
+                return response.status, response.read()
+        except urllib.error.HTTPError as error:
+            return error.code, error.read()
+
+
+# ==================== SESSION ====================
+class LoadTest:
+    def __init__(self, new_transport, args):
+        self.new_transport = new_transport
+        self.args = args
+        self.samples = defaultdict(list)   # endpoint -> [seconds]
+        self.errors = defaultdict(int)     # endpoint -> non-2xx count
+        self.sent = 0
+        self.received = 0
+        self.rejected = 0
+        self._lock = threading.Lock()
+
+    def call(self, transport, endpoint, method, path, payload=None):
+        started = time.perf_counter()
+        status, body = transport.request(method, path, payload)
+        self.samples[endpoint].append(time.perf_counter() - started)
+        if status >= 400:
+            self.errors[endpoint] += 1
+        return status, body
+
+    def poll_query(self):
+        return f'wait={self.args.wait}' if self.args.wait else ''
+
+    def setup_session(self):
+        laptop = self.new_transport()
+        email = f'load-{uuid.uuid4().hex}@example.test'
+        laptop.request('POST', '/signup', {'email': email, 'password': 'load-test'})
+        laptop.request('POST', '/login', {'email': email, 'password': 'load-test'})
+        _, page = self.call(laptop, 'dashboard', 'GET', '/dashboard')
+        token = TOKEN_PATTERN.search(page.decode()).group(1)
+        return laptop, token
+
+    def run_session(self, laptop, token, start_gate):
+        args = self.args
+        phone, display, controller = (self.new_transport() for _ in range(3))
+        controller_done = threading.Event()
+        received = []
+
+        def laptop_role():
+            while True:
+                _, body = self.call(laptop, 'check_ready', 'GET', f'/check_ready/{token}?{self.poll_query()}')
+                if json.loads(body)['ready']:
+                    return
+                if not args.wait:
+                    time.sleep(args.poll_interval)
+
+        def display_role():
+            idle_since = None
+            while True:
+                _, body = self.call(
+                    display, 'get_direction', 'GET',
+                    f'/get_direction?token={token}&max=16&{self.poll_query()}'
+                )
+                answers = json.loads(body)['directions']
+                received.extend(answers)
+                if answers:
+                    idle_since = None
+                elif controller_done.is_set():
+                    # Drain for a grace period after the controller stops
+                    idle_since = idle_since or time.monotonic()
+                    if time.monotonic() - idle_since > args.drain_seconds:
+                        return
+                if not answers and not args.wait:
+                    time.sleep(args.poll_interval)
+
+        def controller_role():
+            sent = rejected = 0
+            for i in range(args.directions):
+                status, _ = self.call(controller, 'submit_direction', 'POST', '/submit_direction', {
+                    'token': token, 'direction': DIRECTIONS[i % len(DIRECTIONS)]
+                })
+                if status == 200:
+                    sent += 1
+                elif status == 429:
+                    rejected += 1
+                time.sleep(args.think_seconds)
+            with self._lock:
+                self.sent += sent
+                self.rejected += rejected
+            controller_done.set()
+
+        start_gate.wait()
+        roles = [threading.Thread(target=fn) for fn in (laptop_role, display_role, controller_role)]
+        for role in roles:
+            role.start()
+        self.call(phone, 'mark_ready', 'POST', f'/mark_ready/{token}')
+        for role in roles:
+            role.join()
+        self.call(laptop, 'submit_score', 'POST', '/submit_score', {'right_eye': 7, 'left_eye': 6})
+        with self._lock:
+            self.received += len(received)
+
+    def run(self):
+        sessions = [self.setup_session() for _ in range(self.args.sessions)]
+        self.samples.clear()
+        self.errors.clear()
+        gate = threading.Barrier(len(sessions) + 1)
+        threads = [
+            threading.Thread(target=self.run_session, args=(laptop, token, gate))
+            for laptop, token in sessions
+        ]
+        for thread in threads:
+            thread.start()
+        gate.wait()
+        started = time.perf_counter()
+        for thread in threads:
+            thread.join()
+        return time.perf_counter() - started
+
+
+# ==================== REPORT ====================
+def rss_bytes(pid):
+    try:
+        with open(f'/proc/{pid}/status') as status:
+            for line in status:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        return None
+
+
+def percentile(values, pct):
+    if len(values) < 2:
+        return values[0] if values else float('nan')
+    return statistics.quantiles(values, n=100)[pct - 1]
+
+
+def report(test, elapsed, rss):
+    total = sum(len(v) for v in test.samples.values())
+    print(f'{test.args.sessions} sessions in {elapsed:.2f}s, {total} requests, {total / elapsed:.0f} req/s')
+    print(f'{"endpoint":<18} {"count":>7} {"p50 ms":>8} {"p99 ms":>8} {"errors":>7}')
+    for endpoint, latencies in sorted(test.samples.items()):
+        print(
+            f'{endpoint:<18} {len(latencies):>7} {percentile(latencies, 50) * 1000:>8.2f}'
+            f' {percentile(latencies, 99) * 1000:>8.2f} {test.errors[endpoint]:>7}'
+        )
+    lost = test.sent - test.received
+    print(
+        f'answers sent {test.sent}, received {test.received}, rejected {test.rejected}, '
+        f'lost {lost} ({lost / test.sent:.2%})' if test.sent else 'no answers sent'
+    )
+    print(f'server RSS {rss / 2 ** 20:.1f} MiB' if rss else 'server RSS unavailable (pass --server-pid)')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sessions', type=int, default=100)
+    parser.add_argument('--directions', type=int, default=10, help='answers per session')
+    parser.add_argument('--poll-interval', type=float, default=0.1)
+    parser.add_argument('--wait', type=float, default=0, help='long-poll seconds instead of polling')
+    parser.add_argument('--think-seconds', type=float, default=0.05, help='pause between answers')
+    parser.add_argument('--drain-seconds', type=float, default=0.5)
+    parser.add_argument('--url', help='drive a running server instead of the in-process app')
+    parser.add_argument('--server-pid', type=int, help='process to read RSS from with --url')
+    args = parser.parse_args()
+
+    if args.url:
+        test = LoadTest(lambda: HTTPTransport(args.url), args)
+        elapsed = test.run()
+        report(test, elapsed, rss_bytes(args.server_pid) if args.server_pid else None)
+        return
+
+    workdir = tempfile.mkdtemp()
+    os.environ.setdefault('SQLALCHEMY_DATABASE_URI', f'sqlite:///{os.path.join(workdir, "load.db")}')
+    os.environ.setdefault('PAIRING_SQLITE_PATH', os.path.join(workdir, 'pairing_state.db'))
+    # Account setup is not what is being measured
+    os.environ.setdefault('PASSWORD_HASH_METHOD', 'pbkdf2:sha256:1000')
+    os.environ.setdefault('PASSWORD_HASH_WORKERS', '0')
+    # Concurrent submit_score commits queue on the write lock; keep the
+    # slow-query log for genuinely slow statements only
+    os.environ.setdefault('SQL_SLOW_QUERY_MS', '1000')
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+    import main as vision_app
+
+    with vision_app.app.app_context():
+        vision_app.upgrade_db()
+    test = LoadTest(lambda: TestClientTransport(vision_app.app), args)
+    elapsed = test.run()
+    report(test, elapsed, rss_bytes(os.getpid()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,177 @@
+"""Memory use of the in-memory pairing store under random-token traffic.
+
+Drives requests with random tokens through the full WSGI stack (metrics,
+fast path, Flask for long polls):
+
+- /check_ready, /get_direction and /check_finished, which must not create state
+- /mark_ready and /submit_direction, which do, but only up to PAIRING_MAX_ENTRIES
+
+tracemalloc samples traced memory after every round. The script also
+measures bytes per active session (ready flag, queued answers, finished
+scores and a pairing code) for capacity planning. It exits 1 if the store
+holds more entries than its bound, or if memory grows once the store is
+full. Growth is the median of the later full rounds minus the median of the
+earlier ones, and it must stay within --slack-sessions times the
+per-session size. A leak scales with traffic and overshoots that bound;
+round-to-round allocator noise does not.
+
+    python benchmarks/pairing_memory.py --quick
+    python benchmarks/pairing_memory.py --requests 2000000 --max-entries 10000
+"""
+import argparse
+import gc
+import io
+import json
+import os
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+
+
+ENVIRON_BASE = {
+    'SERVER_NAME': 'localhost',
+    'SERVER_PORT': '80',
+    'SERVER_PROTOCOL': 'HTTP/1.1',
+    'SCRIPT_NAME': '',
+    'wsgi.version': (1, 0),
+    'wsgi.url_scheme': 'http',
+    'wsgi.errors': sys.stderr,
+    'wsgi.multithread': False,
+    'wsgi.multiprocess': False,
+    'wsgi.run_once': False,
+}
+
+
+def environ(method, path, query='', payload=None):
+    body = json.dumps(payload).encode() if payload is not None else b''
+    env = dict(ENVIRON_BASE)
+    env.update({
+        'REQUEST_METHOD': method,
+        'PATH_INFO': path,
+        'QUERY_STRING': query,
+        'wsgi.input': io.BytesIO(body),
+        'CONTENT_LENGTH': str(len(body)),
+        'CONTENT_TYPE': 'application/json' if payload is not None else '',
+    })
+    return env
+
+
+def start_response(status, headers, exc_info=None):
+    pass
+
+
+def random_request(rng, args, counter):
+    token = f'{rng.getrandbits(64):016x}'
+    if args.long_poll_every and counter % args.long_poll_every == 0:
+        return environ('GET', f'/check_ready/{token}', 'wait=0.001')
+    kind = rng.random()
+    if kind < args.write_ratio / 2:
+        return environ('POST', f'/mark_ready/{token}')
+    if kind < args.write_ratio:
+        return environ('POST', '/submit_direction', payload={'token': token, 'direction': 'up'})
+    return rng.choice((
+        environ('GET', f'/check_ready/{token}'),
+        environ('GET', '/get_direction', f'token={token}&max=4'),
+        environ('GET', f'/check_finished/{token}'),
+    ))
+
+
+def drive(wsgi_app, store, args):
+    rng = random.Random(args.seed)
+    per_round = args.requests // args.rounds
+    samples = []
+    counter = 0
+    for round_number in range(1, args.rounds + 1):
+        started = time.perf_counter()
+        for _ in range(per_round):
+            counter += 1
+            for _ in wsgi_app(random_request(rng, args, counter), start_response):
+                pass
+        elapsed = time.perf_counter() - started
+        gc.collect()
+        current, peak = tracemalloc.get_traced_memory()
+        entries = store.stats()['entries']
+        samples.append((current, entries))
+        print(
+            f'round {round_number:>3}: {counter:>9} requests, {per_round / elapsed:>7.0f} req/s,'
+            f' traced {current / 2 ** 20:7.2f} MiB (peak {peak / 2 ** 20:7.2f}), store entries {entries}'
+        )
+    return samples
+
+
+def bytes_per_session(store_class, sessions):
+    store = store_class(max_entries=sessions)
+    gc.collect()
+    before = tracemalloc.get_traced_memory()[0]
+    for i in range(sessions):
+        token = store.issue_code(i, f'{i:036d}')
+        store.mark_ready(token)
+        for direction in ('up', 'left', 'down'):
+            store.push_direction(token, direction)
+        store.set_finished(token, 7, 6)
+    gc.collect()
+    used = tracemalloc.get_traced_memory()[0] - before
+    return used / sessions, store
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=1000000)
+    parser.add_argument('--rounds', type=int, default=10)
+    parser.add_argument('--max-entries', type=int, default=10000)
+    parser.add_argument('--write-ratio', type=float, default=0.2, help='share of mark_ready/submit_direction')
+    parser.add_argument('--long-poll-every', type=int, default=1000, help='every Nth request is a long poll')
+    parser.add_argument('--sessions', type=int, default=10000, help='active sessions for the per-session figure')
+    parser.add_argument('--slack-sessions', type=float, default=100,
+                        help='allowed growth once full, in per-session sizes')
+    parser.add_argument('--quick', action='store_true',
+                        help='short run (~10s) for routine checks: 60000 requests, 12 rounds, 1000 entries')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    if args.quick:
+        args.requests, args.rounds, args.max_entries = 60000, 12, 1000
+
+    os.environ['PAIRING_BACKEND'] = 'memory'
+    os.environ['METRICS_ENABLED'] = '1'
+    os.environ['PAIRING_MAX_ENTRIES'] = str(args.max_entries)
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+    import main as vision_app
+    from pairing_store import PairingStateStore
+
+    tracemalloc.start()
+    per_session = bytes_per_session(PairingStateStore, args.sessions)[0]
+    gc.collect()
+    app = vision_app.app
+    samples = drive(app.wsgi_app, vision_app.services(app).pairing_store, args)
+
+    failures = []
+    peak_entries = max(entries for _, entries in samples)
+    if peak_entries > args.max_entries:
+        failures.append(f'store grew to {peak_entries} entries, bound is {args.max_entries}')
+    # Once the store has filled up, memory must plateau
+    full = [current for current, entries in samples if entries >= args.max_entries * 0.99]
+    if len(full) >= 4:
+        half = len(full) // 2
+        growth = statistics.median(full[half:]) - statistics.median(full[:half])
+        allowed = args.slack_sessions * per_session
+        print(
+            f'growth over {len(full)} full rounds: {growth / 1024:+.1f} KiB'
+            f' (allowed {allowed / 1024:.1f} KiB, {growth / per_session:+.1f} sessions)'
+        )
+        if growth > allowed:
+            failures.append(f'traced memory grew {growth / 1024:.1f} KiB after the store filled up')
+    else:
+        print('store filled up in fewer than 4 rounds; raise --requests or --rounds to check the plateau')
+
+    print(f'{per_session:.0f} bytes per active session ({args.sessions} sessions)')
+    print(f'{args.max_entries} entries at that size: {per_session * args.max_entries / 2 ** 20:.1f} MiB')
+
+    for failure in failures:
+        print(f'FAIL: {failure}')
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
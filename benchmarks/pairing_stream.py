@@ -0,0 +1,148 @@
+"""Read the pairing event streams end to end and time answer delivery.
+
+For each session, a display reads /pairing/<token>/events?events=ready,direction
+and a controller reads /pairing/<token>/events?events=finished, as the shipped
+pages do. The phone then calls /mark_ready, the controller posts answers to
+/submit_direction, and the test is marked finished. The script exits 1 if a
+stream fails or if any session misses its ready event, an answer (or gets one
+out of order) or its finished event. It reports how long answers take to reach
+the display.
+
+    python benchmarks/pairing_stream.py --sessions 20 --directions 10
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+
+DIRECTIONS = ('up', 'down', 'left', 'right')
+
+
+def read_events(client, path, expect_directions, log):
+    """Append (event, data, received_at) to ``log`` until the stream ends or all
+    expected events have arrived; exceptions are recorded as an 'error' event."""
+    try:
+        response = client.get(path, buffered=False)
+        if response.status_code != 200:
+            log.append(('error', f'HTTP {response.status_code}', time.perf_counter()))
+            return
+        buffer = ''
+        directions = 0
+        try:
+            for chunk in response.response:
+                buffer += chunk.decode() if isinstance(chunk, bytes) else chunk
+                while '\n\n' in buffer:
+                    block, buffer = buffer.split('\n\n', 1)
+                    fields = dict(
+                        line.split(': ', 1) for line in block.splitlines() if ': ' in line and not line.startswith(':')
+                    )
+                    if 'event' not in fields:
+                        continue
+                    log.append((fields['event'], json.loads(fields['data']), time.perf_counter()))
+                    directions += fields['event'] == 'direction'
+                    if fields['event'] == 'finished' or (expect_directions and directions >= expect_directions):
+                        return
+        finally:
+            response.close()
+    except Exception as error:
+        log.append(('error', repr(error), time.perf_counter()))
+
+
+def run_session(app, token, args, sent_at, logs):
+    display_log, controller_log = logs
+    display = threading.Thread(target=read_events, args=(
+        app.test_client(), f'/pairing/{token}/events?events=ready,direction', args.directions, display_log
+    ))
+    controller = threading.Thread(target=read_events, args=(
+        app.test_client(), f'/pairing/{token}/events?events=finished', 0, controller_log
+    ))
+    display.start()
+    controller.start()
+    time.sleep(0.05)  # let both streams subscribe
+
+    client = app.test_client()
+    client.post(f'/mark_ready/{token}')
+    for i in range(args.directions):
+        sent_at[i + 1] = time.perf_counter()
+        client.post('/submit_direction', json={'token': token, 'direction': DIRECTIONS[i % len(DIRECTIONS)]})
+        time.sleep(args.think_seconds)
+    display.join(args.stream_seconds + 5)
+    app.extensions['visioncare'].pairing_store.set_finished(token, 7, 6)
+    controller.join(args.stream_seconds + 5)
+
+
+def check(token, args, sent_at, logs, latencies):
+    display_log, controller_log = logs
+    failures = []
+    for name, log in (('display', display_log), ('controller', controller_log)):
+        failures += [f'{token} {name} stream: {data}' for event, data, _ in log if event == 'error']
+    if not any(event == 'ready' for event, _, _ in display_log):
+        failures.append(f'{token} display never saw ready')
+    answers = [(data['seq'], at) for event, data, at in display_log if event == 'direction']
+    seqs = [seq for seq, _ in answers]
+    if seqs != list(range(1, args.directions + 1)):
+        failures.append(f'{token} display got answers {seqs}, expected 1..{args.directions}')
+    latencies += [at - sent_at[seq] for seq, at in answers if seq in sent_at]
+    finished = [data for event, data, _ in controller_log if event == 'finished']
+    if not finished or finished[0].get('right_eye') != 7:
+        failures.append(f'{token} controller never saw finished')
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sessions', type=int, default=10)
+    parser.add_argument('--directions', type=int, default=10, help='answers per session')
+    parser.add_argument('--think-seconds', type=float, default=0.01, help='pause between answers')
+    parser.add_argument('--stream-seconds', type=int, default=10, help='PAIRING_STREAM_SECONDS for the run')
+    args = parser.parse_args()
+
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+    import main as vision_app
+
+    workdir = tempfile.mkdtemp()
+    app = vision_app.create_app({
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{os.path.join(workdir, "stream.db")}',
+        'PAIRING_STREAM_ENABLED': True,
+        'PAIRING_STREAM_SECONDS': args.stream_seconds,
+        'PAIRING_KEEPALIVE_SECONDS': 1,
+        'PASSWORD_HASH_WORKERS': 0,
+    })
+
+    sessions = []
+    for i in range(args.sessions):
+        token = f'stream{i:04d}'
+        sent_at, logs = {}, ([], [])
+        thread = threading.Thread(target=run_session, args=(app, token, args, sent_at, logs))
+        sessions.append((token, sent_at, logs, thread))
+    started = time.perf_counter()
+    for *_, thread in sessions:
+        thread.start()
+    for *_, thread in sessions:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    failures, latencies = [], []
+    for token, sent_at, logs, _ in sessions:
+        failures += check(token, args, sent_at, logs, latencies)
+
+    print(f'{args.sessions} sessions, {args.directions} answers each, {elapsed:.2f}s')
+    if latencies:
+        latencies.sort()
+        p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+        print(
+            f'answer delivery: {len(latencies)} answers, p50 {statistics.median(latencies) * 1000:.2f} ms,'
+            f' p99 {p99 * 1000:.2f} ms, max {latencies[-1] * 1000:.2f} ms'
+        )
+    for failure in failures:
+        print(f'FAIL: {failure}')
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
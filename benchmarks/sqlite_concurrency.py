@@ -0,0 +1,147 @@
+"""Read/write concurrency on SQLite with and without the production profile.
+
+Reader threads run the dashboard's first-page query while writer threads
+insert results one commit at a time, the way sync-mode /submit_score does.
+Each profile gets a fresh database file with the same seed data.
+
+    python benchmarks/sqlite_concurrency.py --seconds 10 --readers 8 --writers 4
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from db_profile import install_sqlite_profile, sqlite_engine_options  # noqa: E402
+
+
+SCHEMA = (
+    'CREATE TABLE vision_test_result ('
+    ' id INTEGER PRIMARY KEY, user_id INTEGER NOT NULL,'
+    ' right_eye_score INTEGER NOT NULL, left_eye_score INTEGER NOT NULL,'
+    ' timestamp DATETIME NOT NULL)',
+    'CREATE INDEX ix_vision_test_result_user_timestamp'
+    ' ON vision_test_result (user_id, timestamp DESC, id DESC)',
+)
+READ = text(
+    'SELECT id, right_eye_score, left_eye_score, timestamp FROM vision_test_result'
+    ' WHERE user_id = :user_id ORDER BY timestamp DESC, id DESC LIMIT 20'
+)
+WRITE = text(
+    'INSERT INTO vision_test_result (user_id, right_eye_score, left_eye_score, timestamp)'
+    ' VALUES (:user_id, :right, :left, :timestamp)'
+)
+
+
+def profile_config(profile, path):
+    return {
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{path}',
+        'SQLITE_PROFILE': profile,
+        'SQLITE_BUSY_TIMEOUT_MS': 5000,
+        'SQLITE_MMAP_BYTES': 256 * 1024 * 1024,
+        'SQLITE_CACHE_KIB': 16384,
+        'SQLITE_POOL_SIZE': 8,
+        'SQLITE_POOL_OVERFLOW': 16,
+        'SQLITE_POOL_TIMEOUT_SECONDS': 10,
+    }
+
+
+def build_engine(profile, path, users, rows):
+    config = profile_config(profile, path)
+    engine = create_engine(config['SQLALCHEMY_DATABASE_URI'], **sqlite_engine_options(config))
+    install_sqlite_profile(engine, config)
+    start = datetime(2024, 1, 1)
+    with engine.begin() as conn:
+        for statement in SCHEMA:
+            conn.execute(text(statement))
+        conn.execute(WRITE, [
+            {
+                'user_id': i % users + 1,
+                'right': random.randint(0, 8),
+                'left': random.randint(0, 8),
+                'timestamp': start + timedelta(minutes=i),
+            }
+            for i in range(rows)
+        ])
+    return engine
+
+
+def worker(engine, kind, users, deadline, latencies, errors):
+    while time.perf_counter() < deadline:
+        user_id = random.randint(1, users)
+        began = time.perf_counter()
+        try:
+            if kind == 'read':
+                with engine.connect() as conn:
+                    conn.execute(READ, {'user_id': user_id}).fetchall()
+            else:
+                with engine.begin() as conn:
+                    conn.execute(WRITE, {
+                        'user_id': user_id,
+                        'right': random.randint(0, 8),
+                        'left': random.randint(0, 8),
+                        'timestamp': datetime.utcnow(),
+                    })
+        except OperationalError:
+            errors.append(kind)
+            continue
+        latencies.append(time.perf_counter() - began)
+
+
+def percentile(values, pct):
+    if not values:
+        return float('nan')
+    return statistics.quantiles(values, n=100)[pct - 1] if len(values) > 1 else values[0]
+
+
+def run(profile, args):
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = build_engine(profile, os.path.join(tmp, 'bench.db'), args.users, args.rows)
+        reads, writes, errors = [], [], []
+        deadline = time.perf_counter() + args.seconds
+        threads = [
+            threading.Thread(target=worker, args=(engine, 'read', args.users, deadline, reads, errors))
+            for _ in range(args.readers)
+        ] + [
+            threading.Thread(target=worker, args=(engine, 'write', args.users, deadline, writes, errors))
+            for _ in range(args.writers)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        engine.dispose()
+
+    for kind, latencies in (('read', reads), ('write', writes)):
+        print(
+            f'{profile:<10} {kind:<5} {len(latencies) / args.seconds:>9.0f} ops/s'
+            f'  p50 {percentile(latencies, 50) * 1000:7.2f} ms'
+            f'  p99 {percentile(latencies, 99) * 1000:7.2f} ms'
+            f'  errors {errors.count(kind)}'
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--readers', type=int, default=8)
+    parser.add_argument('--writers', type=int, default=4)
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--rows', type=int, default=20000)
+    parser.add_argument('--profile', choices=('default', 'production', 'both'), default='both')
+    args = parser.parse_args()
+
+    for profile in ('default', 'production') if args.profile == 'both' else (args.profile,):
+        run(profile, args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+"""Cold-start time of the app: importing main and calling create_app().
+
+Each run starts a fresh interpreter with ``-X importtime``. The script
+reports the median wall time of the import and of create_app(), and lists
+the modules with the largest cumulative import time. It exits 1 if the
+median total is over ``--budget-ms`` or if startup imports a module that
+should only load on first use (the QR/imaging stack).
+
+    python benchmarks/startup_time.py --runs 7 --budget-ms 750
+"""
+import argparse
+import ast
+import os
+import statistics
+import subprocess
+import sys
+
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+# Loaded by the first /generate_qr, never at startup
+DEFERRED_MODULES = ('qrcode', 'PIL')
+# Only builtins before the clock stops, so the report lists main's imports
+PROBE = '''
+import sys, time
+started = time.perf_counter()
+import main
+imported = time.perf_counter()
+main.create_app()
+created = time.perf_counter()
+print(repr({
+    'import_ms': (imported - started) * 1000,
+    'create_app_ms': (created - imported) * 1000,
+    'modules': sorted(sys.modules),
+}))
+'''
+
+
+def run_probe():
+    env = dict(os.environ, PASSWORD_HASH_WORKERS='0')
+    proc = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', PROBE],
+        cwd=ROOT, env=env, capture_output=True, text=True, check=True
+    )
+    return ast.literal_eval(proc.stdout.splitlines()[-1]), parse_importtime(proc.stderr)
+
+
+def parse_importtime(stderr):
+    """{module: cumulative microseconds} for the top-level imports of main."""
+    cumulative = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, total_us, name = line.split('|')
+        depth = (len(name) - len(name.lstrip())) // 2
+        # main sits at depth 0; its direct imports at depth 1
+        if depth <= 1:
+            cumulative[name.strip()] = int(total_us)
+    return cumulative
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--budget-ms', type=float, default=750, help='median import + create_app() limit')
+    parser.add_argument('--top', type=int, default=10, help='slowest imports to list')
+    args = parser.parse_args()
+
+    samples, profiles = [], []
+    for _ in range(args.runs):
+        sample, profile = run_probe()
+        samples.append(sample)
+        profiles.append(profile)
+
+    import_ms = statistics.median(s['import_ms'] for s in samples)
+    create_ms = statistics.median(s['create_app_ms'] for s in samples)
+    total_ms = statistics.median(s['import_ms'] + s['create_app_ms'] for s in samples)
+    print(f'import main      {import_ms:8.1f} ms')
+    print(f'create_app()     {create_ms:8.1f} ms')
+    print(f'total (median)   {total_ms:8.1f} ms  budget {args.budget_ms:.0f} ms  ({args.runs} runs)')
+
+    print(f'\n{"module":<40} {"cumulative ms":>14}')
+    names = set().union(*profiles)
+    medians = {
+        name: statistics.median(profile.get(name, 0) for profile in profiles) / 1000 for name in names
+    }
+    for name, ms in sorted(medians.items(), key=lambda item: -item[1])[:args.top]:
+        print(f'{name:<40} {ms:>14.1f}')
+
+    failures = []
+    if total_ms > args.budget_ms:
+        failures.append(f'startup took {total_ms:.1f} ms, budget is {args.budget_ms:.0f} ms')
+    loaded = {name.split('.')[0] for sample in samples for name in sample['modules']}
+    for name in DEFERRED_MODULES:
+        if name in loaded:
+            failures.append(f'{name} is imported at startup; it should load on first use')
+
+    for failure in failures:
+        print(f'FAIL: {failure}')
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+from sqlalchemy import event
+
+
+# ==================== SQLITE PROFILES ====================
+# 'production' switches file databases to WAL so readers no longer block
+# behind a writer, relaxes fsync to once per checkpoint (synchronous=NORMAL)
+# and waits on a locked database instead of failing straight away.
+# Any other value leaves SQLite and the pool as SQLAlchemy configures them.
+def is_sqlite_file(uri):
+    if not uri.startswith('sqlite'):
+        return False
+    path = uri.split('://', 1)[-1]
+    return path not in ('', '/') and ':memory:' not in path and 'mode=memory' not in path
+
+
+def sqlite_engine_options(config):
+    if config['SQLITE_PROFILE'] != 'production' or not is_sqlite_file(config['SQLALCHEMY_DATABASE_URI']):
+        return {}
+    return {
+        'pool_size': config['SQLITE_POOL_SIZE'],
+        'max_overflow': config['SQLITE_POOL_OVERFLOW'],
+        'pool_timeout': config['SQLITE_POOL_TIMEOUT_SECONDS'],
+        'connect_args': {
+            'timeout': config['SQLITE_BUSY_TIMEOUT_MS'] / 1000,
+            'check_same_thread': False,
+        },
+    }
+
+
+def sqlite_pragmas(config):
+    return (
+        ('journal_mode', 'WAL'),
+        ('synchronous', 'NORMAL'),
+        ('busy_timeout', config['SQLITE_BUSY_TIMEOUT_MS']),
+        ('mmap_size', config['SQLITE_MMAP_BYTES']),
+        # Negative cache_size is in KiB rather than pages
+        ('cache_size', -config['SQLITE_CACHE_KIB']),
+        ('temp_store', 'MEMORY'),
+    )
+
+
+def install_sqlite_profile(engine, config):
+    """Run the profile's pragmas on every new DBAPI connection of ``engine``."""
+    if config['SQLITE_PROFILE'] != 'production' or engine.dialect.name != 'sqlite':
+        return
+    if not is_sqlite_file(str(engine.url)):
+        return
+    pragmas = sqlite_pragmas(config)
+
+    @event.listens_for(engine, 'connect')
+    def apply_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas:
+            cursor.execute(f'PRAGMA {name}={value}')
+        cursor.close()
@@ -0,0 +1,168 @@
+import io
+import json
+from http import HTTPStatus
+from urllib.parse import parse_qs
+
+from metrics import ENDPOINT_KEY
+
+
+# ==================== PAIRING FAST PATH ====================
+class PairingFastPath:
+    """WSGI middleware answering the short pairing polls straight from the store.
+
+    /mark_ready, /check_ready, /submit_direction, /get_direction,
+    /check_finished and /pairing/<token>/state need no session, template or
+    ORM, so they skip Flask's routing and context setup here. Anything else,
+    including long polls (``wait=``), preflights and bodies that are not a
+    JSON object, is passed to the wrapped application unchanged. Responses
+    match what the Flask views return, including the CORS headers for
+    credentialed requests.
+
+    The shipped pages long-poll /pairing/<token>/state or use the event
+    stream, so of their traffic only /mark_ready and /submit_direction take
+    this path; the polling endpoints serve scripts and fallback clients.
+    """
+
+    def __init__(self, app, store, queue_size, score_payload):
+        self.app = app
+        self.store = store
+        self.queue_size = queue_size
+        self.score_payload = score_payload
+        self.served = 0
+        self.delegated = 0
+        self._routes = {
+            ('POST', 'mark_ready'): self.mark_ready,
+            ('GET', 'check_ready'): self.check_ready,
+            ('POST', 'submit_direction'): self.submit_direction,
+            ('GET', 'get_direction'): self.get_direction,
+            ('GET', 'check_finished'): self.check_finished,
+            ('GET', 'pairing_state'): self.pairing_state,
+        }
+
+    def __call__(self, environ, start_response):
+        response = self.dispatch(environ)
+        if response is None:
+            self.delegated += 1
+            return self.app(environ, start_response)
+        self.served += 1
+        status, payload = response
+        body = (json.dumps(payload, separators=(',', ':'), sort_keys=True) + '\n').encode()
+        headers = [('Content-Type', 'application/json'), ('Content-Length', str(len(body)))]
+        origin = environ.get('HTTP_ORIGIN')
+        if origin:
+            headers += [
+                ('Access-Control-Allow-Origin', origin),
+                ('Access-Control-Allow-Credentials', 'true'),
+                ('Vary', 'Origin'),
+            ]
+        start_response(f'{status} {HTTPStatus(status).phrase.upper()}', headers)
+        return [body]
+
+    def dispatch(self, environ):
+        # /<name>, /<name>/<token> or /pairing/<token>/state; returns None to delegate
+        parts = environ.get('PATH_INFO', '').split('/')
+        if parts[0]:
+            return None
+        if len(parts) == 4 and parts[1] == 'pairing' and parts[3] == 'state':
+            name, token = 'pairing_state', parts[2]
+        elif len(parts) in (2, 3) and parts[1] != 'pairing_state':
+            name, token = parts[1], parts[2] if len(parts) == 3 else None
+        else:
+            return None
+        handler = self._routes.get((environ['REQUEST_METHOD'], name))
+        if handler is None:
+            return None
+        if (token is None) != (name in ('submit_direction', 'get_direction')) or token == '':
+            return None
+        query = parse_qs(environ.get('QUERY_STRING', ''))
+        if 'wait' in query:
+            return None
+        environ[ENDPOINT_KEY] = name
+        return handler(environ, token, query)
+
+    # -------------------- endpoints --------------------
+    def mark_ready(self, environ, token, query):
+        self.store.mark_ready(token)
+        return 200, {'status': 'ready'}
+
+    def check_ready(self, environ, token, query):
+        return 200, {'ready': self.store.is_ready(token)}
+
+    def submit_direction(self, environ, token, query):
+        data = self._json_body(environ)
+        if data is None:
+            return None
+        token = data.get('token')
+        if not token:
+            return 400, {'error': 'Missing token'}
+        seq = self.store.push_direction(token, data.get('direction'))
+        if seq is None:
+            return 429, {'error': 'Too many pending answers'}
+        return 200, {'status': 'received', 'seq': seq}
+
+    def get_direction(self, environ, token, query):
+        token = query.get('token', [None])[0]
+        if not token:
+            return None
+        try:
+            limit = int(query.get('max', ['1'])[0])
+        except ValueError:
+            limit = 1
+        limit = max(1, min(limit, self.queue_size))
+        answers = [
+            {'seq': seq, 'direction': direction}
+            for seq, direction in self.store.pop_directions(token, limit)
+        ]
+        return 200, {
+            'direction': answers[0]['direction'] if answers else None,
+            'directions': answers
+        }
+
+    def check_finished(self, environ, token, query):
+        finished = self.store.get_finished(token)
+        if finished:
+            return 200, {'finished': True, **self.score_payload(finished)}
+        return 200, {'finished': False}
+
+    def pairing_state(self, environ, token, query):
+        try:
+            consume = int(query.get('consume', ['0'])[0])
+        except ValueError:
+            consume = 0
+        consume = max(0, min(consume, self.queue_size))
+        state = self.store.snapshot(token, consume)
+        finished = state['finished']
+        return 200, {
+            'version': state['version'],
+            'ready': state['ready'],
+            'seq': state['seq'],
+            'acked': state['acked'],
+            'pending': state['pending'],
+            'directions': [
+                {'seq': seq, 'direction': direction} for seq, direction in state['directions']
+            ],
+            'finished': finished is not None,
+            'scores': self.score_payload(finished) if finished else None
+        }
+
+    # -------------------- helpers --------------------
+    @staticmethod
+    def _json_body(environ):
+        # Leaves a readable body behind for the Flask app if we delegate.
+        # Without a usable Content-Length (e.g. a chunked body) the input is
+        # not touched at all, so the server's own stream reaches Flask.
+        if not environ.get('CONTENT_TYPE', '').startswith('application/json'):
+            return None
+        try:
+            length = int(environ.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            return None
+        if length <= 0:
+            return None
+        raw = environ['wsgi.input'].read(length)
+        environ['wsgi.input'] = io.BytesIO(raw)
+        try:
+            data = json.loads(raw)
+        except ValueError:
+            return None
+        return data if isinstance(data, dict) else None
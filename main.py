@@ -1,30 +1,108 @@
 import os
-from flask import Flask, request, jsonify, session, render_template, redirect, url_for, send_file
+from flask import Blueprint, Flask, Response, current_app, g, make_response, request, jsonify, session, render_template, redirect, url_for, stream_with_context
 from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
-from werkzeug.security import generate_password_hash, check_password_hash
-from datetime import datetime
-from collections import defaultdict
+from markupsafe import Markup
+from werkzeug.local import LocalProxy
+from datetime import datetime, timezone
+from sqlalchemy import func, inspect, text, tuple_
+from db_profile import install_sqlite_profile, sqlite_engine_options
+from query_instrumentation import install_query_instrumentation
+from pairing_store import create_pairing_store
+from caching import BoundedLRUCache
+from result_writer import ResultWriteQueue
+from password_hashing import HashingBusy, PasswordHasher
+from fast_path import PairingFastPath
+from metrics import ENDPOINT_KEY, UNMATCHED, MetricsMiddleware, MetricsRegistry
+from concurrent.futures import TimeoutError as ResultWriteTimeout
+import atexit
+from functools import partial
+from collections import namedtuple
+from qr_codes import ERROR_CORRECTION as QR_ERROR_CORRECTION, MIMETYPES as QR_MIMETYPES, render_qr
+import hashlib
+import hmac
 import uuid
-import qrcode
+import base64
+import csv
 import io
+import json
 import re
+import time
 
 
-app = Flask(__name__)
-@app.route('/')
+# Views are registered on the app by create_app()
+bp = Blueprint('vision', __name__, cli_group=None)
+
+
+@bp.route('/')
 def home():
     return redirect('/login')
 
-app.secret_key = os.getenv('SECRET_KEY', 'fallback-secret')  # fallback is optional
-app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('SQLALCHEMY_DATABASE_URI', 'sqlite:///vision_test.db')
-db = SQLAlchemy(app)
-CORS(app, supports_credentials=True)
 
-# ==================== IN-MEMORY SYNC STATE ====================
-session_ready = {}
-latest_directions = defaultdict(lambda: None)
-finished_tests = {}
+db = SQLAlchemy()
+
+# ==================== SERVICES ====================
+SERVICES_KEY = 'visioncare'
+
+
+class Services:
+    """The pairing store, caches, worker pools and metrics of one app.
+
+    create_app() stores an instance in ``app.extensions``; request code
+    reaches it through the module-level proxies below, so each app keeps
+    its own state.
+    """
+
+    def __init__(self, app):
+        config = app.config
+        if config['PAIRING_BACKEND'] == 'sqlite':
+            os.makedirs(app.instance_path, exist_ok=True)
+        self.pairing_store = create_pairing_store(config)
+        self.qr_cache = BoundedLRUCache(
+            max_entries=config['QR_CACHE_ENTRIES'],
+            max_bytes=config['QR_CACHE_BYTES'],
+            sizeof=lambda entry: len(entry[1])
+        )
+        self.dashboard_cache = BoundedLRUCache(
+            max_entries=config['DASHBOARD_CACHE_ENTRIES'],
+            max_bytes=config['DASHBOARD_CACHE_BYTES'],
+            sizeof=lambda entry: len(entry[1])
+        )
+        self.identity_cache = BoundedLRUCache(
+            max_entries=config['IDENTITY_CACHE_ENTRIES'],
+            max_bytes=None,
+            ttl=config['IDENTITY_CACHE_SECONDS']
+        )
+        self.password_hasher = PasswordHasher(
+            method=config['PASSWORD_HASH_METHOD'],
+            workers=config['PASSWORD_HASH_WORKERS'],
+            max_pending=config['PASSWORD_HASH_MAX_PENDING'],
+            timeout=config['PASSWORD_HASH_TIMEOUT_SECONDS']
+        )
+        self.result_queue = ResultWriteQueue(
+            partial(write_result_batch, app),
+            max_size=config['RESULT_WRITE_QUEUE_SIZE'],
+            batch_size=config['RESULT_WRITE_BATCH_SIZE'],
+            flush_interval=config['RESULT_WRITE_FLUSH_MS'] / 1000
+        )
+        self.metrics_registry = MetricsRegistry()
+
+    def close(self):
+        self.result_queue.close()
+        self.password_hasher.close()
+
+
+def services(app=None):
+    return (app or current_app).extensions[SERVICES_KEY]
+
+
+pairing_store = LocalProxy(lambda: services().pairing_store)
+qr_cache = LocalProxy(lambda: services().qr_cache)
+dashboard_cache = LocalProxy(lambda: services().dashboard_cache)
+identity_cache = LocalProxy(lambda: services().identity_cache)
+password_hasher = LocalProxy(lambda: services().password_hasher)
+result_queue = LocalProxy(lambda: services().result_queue)
+metrics_registry = LocalProxy(lambda: services().metrics_registry)
 
 # ==================== MODELS ====================
 class User(db.Model):
@@ -43,13 +121,230 @@ class VisionTestResult(db.Model):
     left_eye_score = db.Column(db.Integer, nullable=False)
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
 
+# History is always read per user, newest first; id breaks timestamp ties
+# so the (timestamp, id) pair can serve as a keyset pagination cursor.
+db.Index(
+    'ix_vision_test_result_user_timestamp',
+    VisionTestResult.user_id,
+    VisionTestResult.timestamp.desc(),
+    VisionTestResult.id.desc()
+)
+
+class UserResultSummary(db.Model):
+    # Denormalized view of a user's history, kept current by /submit_score in
+    # the same transaction as the result insert so the dashboard header and
+    # recommendations never have to read vision_test_result.
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    latest_right_eye_score = db.Column(db.Integer, nullable=False)
+    latest_left_eye_score = db.Column(db.Integer, nullable=False)
+    recommendation_tier = db.Column(db.String(20), nullable=False)
+    test_count = db.Column(db.Integer, nullable=False, default=0)
+    first_timestamp = db.Column(db.DateTime, nullable=False)
+    last_timestamp = db.Column(db.DateTime, nullable=False)
+    # Bumped on every write; drives the ETags of /dashboard and /my_results
+    result_version = db.Column(db.Integer, nullable=False, default=0)
+
+
+def record_result_summary(result):
+    # Atomic increment, so concurrent submissions cannot lose a count.
+    values = {
+        'latest_right_eye_score': result.right_eye_score,
+        'latest_left_eye_score': result.left_eye_score,
+        'recommendation_tier': recommendation_tier(result.right_eye_score, result.left_eye_score),
+        'last_timestamp': result.timestamp,
+    }
+    updated = UserResultSummary.query.filter_by(user_id=result.user_id).update(
+        {
+            **values,
+            'test_count': UserResultSummary.test_count + 1,
+            'result_version': UserResultSummary.result_version + 1,
+        },
+        synchronize_session=False
+    )
+    if not updated:
+        db.session.add(UserResultSummary(
+            user_id=result.user_id,
+            test_count=1,
+            first_timestamp=result.timestamp,
+            result_version=1,
+            **values
+        ))
+
+
+def rebuild_result_summary(user_id):
+    summary = db.session.get(UserResultSummary, user_id)
+    latest = VisionTestResult.query.filter_by(user_id=user_id).order_by(
+        VisionTestResult.timestamp.desc(), VisionTestResult.id.desc()
+    ).first()
+    if latest is None:
+        if summary is not None:
+            db.session.delete(summary)
+        return
+    test_count, first_timestamp = db.session.query(
+        func.count(VisionTestResult.id), func.min(VisionTestResult.timestamp)
+    ).filter_by(user_id=user_id).one()
+    if summary is None:
+        summary = UserResultSummary(user_id=user_id, result_version=0)
+        db.session.add(summary)
+    summary.result_version += 1
+    summary.latest_right_eye_score = latest.right_eye_score
+    summary.latest_left_eye_score = latest.left_eye_score
+    summary.recommendation_tier = recommendation_tier(latest.right_eye_score, latest.left_eye_score)
+    summary.test_count = test_count
+    summary.first_timestamp = first_timestamp
+    summary.last_timestamp = latest.timestamp
+
+# ==================== DATABASE SETUP ====================
+def upgrade_db():
+    # create_all() skips tables that already exist, including any indexes
+    # added to them later, so create missing indexes explicitly.
+    db.create_all()
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=db.engine, checkfirst=True)
+
+    summary_columns = {c['name'] for c in inspect(db.engine).get_columns('user_result_summary')}
+    if 'result_version' not in summary_columns:
+        db.session.execute(text(
+            'ALTER TABLE user_result_summary ADD COLUMN result_version INTEGER NOT NULL DEFAULT 0'
+        ))
+
+    # Backfill summaries for users whose results predate UserResultSummary
+    missing = db.session.query(VisionTestResult.user_id).outerjoin(
+        UserResultSummary, UserResultSummary.user_id == VisionTestResult.user_id
+    ).filter(UserResultSummary.user_id.is_(None)).distinct().all()
+    for (user_id,) in missing:
+        rebuild_result_summary(user_id)
+    db.session.commit()
+
+
+@bp.cli.command('upgrade-db')
+def upgrade_db_command():
+    upgrade_db()
+    print('Database is up to date.')
+
+# ==================== RESULT HISTORY PAGINATION ====================
+def encode_cursor(result):
+    raw = f"{result.timestamp.isoformat()}|{result.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        timestamp, result_id = raw.split('|')
+        return datetime.fromisoformat(timestamp), int(result_id)
+    except ValueError:
+        return None
+
+
+def result_page(user_id, cursor, limit):
+    # Keyset pagination: seek past the cursor's (timestamp, id) through the
+    # composite index instead of OFFSET, so every page costs the same.
+    # limit=None returns everything after the cursor.
+    query = VisionTestResult.query.filter_by(user_id=user_id)
+    if cursor:
+        query = query.filter(
+            tuple_(VisionTestResult.timestamp, VisionTestResult.id) < tuple_(*cursor)
+        )
+    query = query.order_by(VisionTestResult.timestamp.desc(), VisionTestResult.id.desc())
+    if limit is None:
+        return query.all(), None
+    rows = query.limit(limit + 1).all()
+    next_cursor = encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+    return rows[:limit], next_cursor
+
+# ==================== CONDITIONAL GET ====================
+# Bump when the rendered output of /dashboard or /my_results changes shape,
+# so clients holding an old ETag re-download after a deploy.
+RESULT_ETAG_REVISION = 1
+
+
+def result_etag(*parts):
+    key = '|'.join(str(part) for part in (RESULT_ETAG_REVISION, *parts))
+    return hashlib.sha1(key.encode()).hexdigest()
+
+
+def is_fresh(etag, last_modified=None):
+    if request.if_none_match:
+        return request.if_none_match.contains(etag)
+    if last_modified is None or request.if_modified_since is None:
+        return False
+    return last_modified.replace(microsecond=0, tzinfo=timezone.utc) <= request.if_modified_since
+
+
+def with_validators(response, etag, last_modified=None):
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = last_modified.replace(tzinfo=timezone.utc)
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
+# ==================== CURRENT USER ====================
+UserIdentity = namedtuple('UserIdentity', 'id user_uuid first_name last_name')
+IDENTITY_COLUMNS = (User.id, User.user_uuid, User.first_name, User.last_name)
+
+
+def remember_identity(identity):
+    identity = UserIdentity(*identity)
+    identity_cache.set(('id', identity.id), identity)
+    identity_cache.set(('uuid', identity.user_uuid), identity)
+    return identity
+
+
+def load_identity(column, key):
+    identity = identity_cache.get((column, key))
+    if identity is None:
+        row = db.session.query(*IDENTITY_COLUMNS).filter(
+            User.id == key if column == 'id' else User.user_uuid == key
+        ).first()
+        identity = remember_identity(row) if row else None
+    return identity
+
+
+def current_user():
+    """The logged-in user's UserIdentity, loaded at most once per request."""
+    if 'current_user' not in g:
+        user_id = session.get('user_id')
+        g.current_user = load_identity('id', user_id) if user_id is not None else None
+    return g.current_user
+
+# ==================== PAIRING TOKENS ====================
+def resolve_pairing_token(token):
+    # Pairing codes resolve from the pairing store; full user UUIDs from
+    # QR codes printed before pairing codes existed still fall back to the DB.
+    identity = pairing_store.resolve_code(token)
+    if identity is None and len(token) == 36:
+        user = load_identity('uuid', token)
+        if user:
+            identity = (user.id, user.user_uuid)
+    return identity
+
+
+def owns_pairing_token(token):
+    # /test-display remembers the code it validated, so a code that expires
+    # or rotates mid-test can still be finished by the same browser
+    if token == session.get('pairing_token'):
+        return True
+    identity = resolve_pairing_token(token)
+    return identity is not None and identity[0] == session.get('user_id')
+
 # ==================== DEVICE DETECTOR ====================
 def is_mobile_device(user_agent):
     mobile_regex = re.compile(r"iphone|android|blackberry|mobile|webos", re.IGNORECASE)
     return mobile_regex.search(user_agent) is not None
 
+# ==================== PASSWORD HASHING ====================
+@bp.app_errorhandler(HashingBusy)
+def hashing_busy(error):
+    response = jsonify({'error': 'Server busy, please try again'})
+    response.status_code = 503
+    response.headers['Retry-After'] = '1'
+    return response
+
 # ==================== AUTH & USER ROUTES ====================
-@app.route('/signup', methods=['POST'])
+@bp.route('/signup', methods=['POST'])
 def signup():
     data = request.json
     email = data['email']
@@ -63,7 +358,7 @@ def signup():
 
     user = User(
         email=email,
-        password_hash=generate_password_hash(password),
+        password_hash=password_hasher.hash(password),
         user_uuid=str(uuid.uuid4()),
         first_name=first_name,
         last_name=last_name,
@@ -74,17 +369,22 @@ def signup():
     return jsonify({'message': 'Signup successful'})
 
 
-@app.route('/login', methods=['GET', 'POST'])
+@bp.route('/login', methods=['GET', 'POST'])
 def login():
     if request.method == 'POST':
         data = request.get_json()
         email = data['email']
         password = data['password']
         user = User.query.filter_by(email=email).first()
-        if not user or not check_password_hash(user.password_hash, password):
+        if not user or not password_hasher.verify(user.password_hash, password):
             return jsonify({'error': 'Invalid credentials'}), 401
+        if password_hasher.needs_rehash(user.password_hash):
+            user.password_hash = password_hasher.hash(password)
+            db.session.commit()
 
         session['user_id'] = user.id
+        session.pop('pairing_token', None)
+        remember_identity((user.id, user.user_uuid, user.first_name, user.last_name))
 
         user_agent = request.headers.get('User-Agent', '')
         if is_mobile_device(user_agent):
@@ -95,21 +395,54 @@ def login():
     return render_template('login.html')
 
 
-@app.route('/logout')
+@bp.route('/logout')
 def logout():
     session.pop('user_id', None)
+    session.pop('pairing_token', None)
     return redirect('/login')
 
 
 # ==================== QR & DASHBOARD ====================
-@app.route('/dashboard')
+@bp.route('/dashboard')
 def dashboard():
     if 'user_id' not in session:
         return redirect('/login')
 
-    user = User.query.get(session['user_id'])
-    results = VisionTestResult.query.filter_by(user_id=user.id).order_by(VisionTestResult.timestamp.desc()).all()
+    cursor = request.args.get('cursor')
+    position = decode_cursor(cursor) if cursor else None
+    if cursor and position is None:
+        return redirect('/dashboard')
+
+    user = current_user()
+    token = pairing_store.issue_code(user.id, user.user_uuid)
+    pairing_store.reset_ready(token)
+
+    # Unchanged history and pairing code: answer 304 before touching results
+    summary = db.session.get(UserResultSummary, user.id)
+    version = summary.result_version if summary else 0
+    etag = result_etag('dashboard', user.id, version, token, request.full_path)
+    if is_fresh(etag):
+        return with_validators(Response(status=304), etag)
 
+    return with_validators(make_response(render_template(
+        "dashboard.html",
+        user=user,
+        cards=dashboard_cards(user.id, summary, cursor, position),
+        token=token,
+        code_refresh_seconds=code_refresh_seconds()
+    )), etag)
+
+
+def dashboard_cards(user_id, summary, cursor, position):
+    # Entries carry the result version they were rendered from, so a stale
+    # page is re-rendered even if it outlived the invalidation in submit_score
+    version = summary.result_version if summary else 0
+    key = (user_id, cursor)
+    entry = dashboard_cache.get(key)
+    if entry is not None and entry[0] == version:
+        return entry[1]
+
+    results, next_cursor = result_page(user_id, position, current_app.config['DASHBOARD_PAGE_SIZE'])
     test_results = [
         {
             "date": r.timestamp.strftime('%B %d, %Y at %I:%M %p'),
@@ -121,188 +454,498 @@ def dashboard():
         for r in results
     ]
 
-
-    session_ready[user.user_uuid] = False
-
     recommendations = []
-    if results:
-        latest = results[0]
-        if latest.right_eye_score <= 3 or latest.left_eye_score <= 3:
-            recommendations.append("⚠️ Schedule a full eye exam. Your results suggest significant vision challenges.")
-        elif latest.right_eye_score < 5 or latest.left_eye_score < 5:
-            recommendations.append("👓 Consider seeing an optometrist for corrective lenses.")
-        elif latest.right_eye_score < 7 or latest.left_eye_score < 7:
-            recommendations.append("Your vision may be slightly reduced. Try reading in better light.")
-        elif latest.right_eye_score >= 7 and latest.left_eye_score >= 7:
-            recommendations.append("✅ Your vision is excellent. Keep up with regular checks!")
-        if not recommendations:
-            recommendations.append("Monitor your vision and retake the test in 1 month.")
-
-    return render_template(
-        "dashboard.html",
-        user=user,
+    if summary:
+        recommendations.append(RECOMMENDATIONS[summary.recommendation_tier])
+
+    cards = Markup(render_template(
+        "dashboard_cards.html",
+        summary=summary,
         test_results=test_results,
         recommendations=recommendations,
-        token=user.user_uuid  
-    )
+        next_cursor=next_cursor,
+        paged=bool(position)
+    ))
+    dashboard_cache.set(key, (version, cards))
+    return cards
 
 
-@app.route('/generate_qr')
+@bp.route('/generate_qr')
 def generate_qr():
     if 'user_id' not in session:
         return redirect('/login')
 
-    user = User.query.get(session['user_id'])
-    test_url = url_for('start_test', token=user.user_uuid, _external=True)
+    # The dashboard asks for the code it is polling on; fall back to the
+    # user's current code for bare /generate_qr requests
+    user = current_user()
+    token = request.args.get('token')
+    identity = pairing_store.resolve_code(token) if token else None
+    if identity is None or identity[0] != user.id:
+        token = pairing_store.issue_code(user.id, user.user_uuid)
+    test_url = url_for('.start_test', token=token, _external=True)
+
+    fmt = request.args.get('format', 'png')
+    error_correction = request.args.get('ec', current_app.config['QR_ERROR_CORRECTION']).upper()
+    if fmt not in QR_MIMETYPES or error_correction not in QR_ERROR_CORRECTION:
+        return jsonify({'error': 'Unsupported QR format'}), 400
+    border = max(0, min(request.args.get('border', current_app.config['QR_BORDER'], type=int), 8))
+    box_size = max(1, min(request.args.get('box', current_app.config['QR_BOX_SIZE'], type=int), 20))
+
+    etag, image = cached_qr(test_url, fmt, error_correction, border, box_size)
+    response = Response(image, mimetype=QR_MIMETYPES[fmt])
+    response.set_etag(etag)
+    # The encoded pairing code rotates and expires, so revalidate every time;
+    # the content-hash ETag keeps that a 304 while the code is unchanged
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+
+def cached_qr(test_url, fmt, error_correction, border, box_size):
+    key = (test_url, fmt, error_correction, border, box_size)
+    entry = qr_cache.get(key)
+    if entry is None:
+        image = render_qr(test_url, fmt, error_correction, border, box_size)
+        entry = (hashlib.sha256(image).hexdigest()[:32], image)
+        qr_cache.set(key, entry)
+    return entry
+
+
+def code_refresh_seconds():
+    # issue_code hands out codes with at least half their lifetime left, so
+    # refreshing every quarter lifetime keeps the shown code valid
+    return max(1, current_app.config['PAIRING_CODE_TTL_SECONDS'] // 4)
 
 
-    qr = qrcode.make(test_url)
-    buffer = io.BytesIO()
-    qr.save(buffer, format='PNG')
-    buffer.seek(0)
-    return send_file(buffer, mimetype='image/png')
+@bp.route('/pairing/code')
+def pairing_code():
+    # The dashboard swaps in the user's current code before its own expires
+    if 'user_id' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+    user = current_user()
+    previous = request.args.get('token')
+    token = pairing_store.issue_code(user.id, user.user_uuid)
+    if token != previous:
+        pairing_store.reset_ready(token)
+    return jsonify({'token': token, 'refresh_seconds': code_refresh_seconds()})
+
+
+# ==================== RESULT WRITES ====================
+def save_results(rows):
+    for row in rows:
+        result = VisionTestResult(**row)
+        db.session.add(result)
+        record_result_summary(result)
+    db.session.commit()
+    for row in rows:
+        dashboard_cache.delete((row['user_id'], None))
 
 
+def write_result_batch(app, rows):
+    # Runs on the writer thread, outside any request
+    with app.app_context():
+        save_results(rows)
+
+
+def store_result(row):
+    """Persist one result; returns False if it was only queued."""
+    if current_app.config['RESULT_WRITE_MODE'] == 'batched':
+        future = result_queue.submit(row)
+        if future is not None:
+            if current_app.config['RESULT_WRITE_ACK'] != 'durable':
+                return False
+            try:
+                return future.result(timeout=current_app.config['RESULT_WRITE_TIMEOUT_SECONDS'])
+            except ResultWriteTimeout:
+                return False
+        # Queue full: write this one inline rather than rejecting it
+    save_results([row])
+    return True
+
 # ==================== VISION TEST ROUTES ====================
-@app.route('/start-test')
+@bp.route('/start-test')
 def start_test():
     token = request.args.get('token')
     if 'user_id' not in session:
         if token:
-            user = User.query.filter_by(user_uuid=token).first()
-            if user:
-                session['user_id'] = user.id
+            identity = resolve_pairing_token(token)
+            if identity:
+                session['user_id'] = identity[0]
             else:
                 return "Invalid token", 403
         else:
             return redirect('/login')
     
     # >>> Reset finished test if scanning again <<<
-    if token in finished_tests:
-        del finished_tests[token]
+    if token:
+        pairing_store.clear_finished(token)
 
     return render_template("start_test.html")
 
 
-@app.route('/vision_test')
+@bp.route('/vision_test')
 def vision_test():
     if 'user_id' not in session:
-        return redirect(url_for('login'))
+        return redirect(url_for('.login'))
     return render_template('test.html')
 
 
-@app.route('/submit_score', methods=['POST'])
+@bp.route('/submit_score', methods=['POST'])
 def submit_score():
     if 'user_id' not in session:
         return jsonify({'error': 'Not logged in'}), 403
 
     data = request.get_json()
-    result = VisionTestResult(
-        user_id=session['user_id'],
-        right_eye_score=data['right_eye'],
-        left_eye_score=data['left_eye']
-    )
-    db.session.add(result)
-    db.session.commit()
+    token = data.get('token')
+    if token and not owns_pairing_token(token):
+        return jsonify({'error': 'Invalid token'}), 403
 
-    # Mark test as finished for controller
-    token = User.query.get(session['user_id']).user_uuid
-    finished_tests[token] = {
-        'right_eye': data['right_eye'],
-        'left_eye': data['left_eye']
-    }
+    saved = store_result({
+        'user_id': session['user_id'],
+        'right_eye_score': data['right_eye'],
+        'left_eye_score': data['left_eye'],
+        'timestamp': datetime.utcnow(),
+    })
+
+    # Mark test as finished for the controller paired with this display; pages
+    # that send no token fall back to the user's current code, or their UUID
+    # for older QR codes
+    if token:
+        tokens = (token,)
+    else:
+        tokens = filter(None, (pairing_store.user_code(session['user_id']), current_user().user_uuid))
+    for finished_token in tokens:
+        pairing_store.set_finished(finished_token, data['right_eye'], data['left_eye'])
 
     right_acuity = calculate_visual_acuity(data['right_eye'])
     left_acuity = calculate_visual_acuity(data['left_eye'])
 
     return jsonify({
-        'message': 'Result saved',
+        'message': 'Result saved' if saved else 'Result queued',
         'right_eye_score': data['right_eye'],
         'left_eye_score': data['left_eye'],
         'right_eye_acuity': right_acuity,
         'left_eye_acuity': left_acuity
-    })
+    }), 200 if saved else 202
 
-@app.route('/check_finished/<token>')
+@bp.route('/check_finished/<token>')
 def check_finished(token):
-    def calculate_visual_acuity(score, max_score=8):
-        acuity_scale = {
-            8: "20/20",
-            7: "20/25",
-            6: "20/30",
-            5: "20/40",
-            4: "20/50",
-            3: "20/60",
-            2: "20/80",
-            1: "20/100",
-            0: "worse than 20/100"
-        }
-        return acuity_scale.get(score, "Unknown")
-
-    if token in finished_tests:
-        right_score = finished_tests[token]['right_eye']
-        left_score = finished_tests[token]['left_eye']
-
-        return jsonify({
-            'finished': True,
-            'right_eye': right_score,
-            'left_eye': left_score,
-            'right_acuity': calculate_visual_acuity(right_score),
-            'left_acuity': calculate_visual_acuity(left_score)
-        })
+    finished = long_poll(token, lambda: pairing_store.get_finished(token), wait_seconds())
+    if finished:
+        return jsonify(finished_payload(finished))
     return jsonify({'finished': False})
 
 
+def finished_payload(finished):
+    return {'finished': True, **score_payload(finished)}
+
 
-@app.route('/my_results', methods=['GET'])
+def score_payload(finished):
+    right_score = finished['right_eye']
+    left_score = finished['left_eye']
+    return {
+        'right_eye': right_score,
+        'left_eye': left_score,
+        'right_acuity': calculate_visual_acuity(right_score),
+        'left_acuity': calculate_visual_acuity(left_score)
+    }
+
+
+
+@bp.route('/my_results', methods=['GET'])
 def my_results():
     if 'user_id' not in session:
         return jsonify({'error': 'Unauthorized'}), 401
 
-    results = VisionTestResult.query.filter_by(user_id=session['user_id']).order_by(VisionTestResult.timestamp.desc()).all()
-    return jsonify([
+    fmt = request.args.get('format', 'json')
+    if fmt not in EXPORT_MIMETYPES and fmt != 'json':
+        return jsonify({'error': 'Unsupported format'}), 400
+
+    summary = db.session.query(
+        UserResultSummary.result_version, UserResultSummary.last_timestamp
+    ).filter_by(user_id=session['user_id']).first()
+    version, last_modified = summary if summary else (0, None)
+    etag = result_etag('my_results', session['user_id'], version, request.full_path)
+    if is_fresh(etag, last_modified):
+        return with_validators(Response(status=304), etag, last_modified)
+    if fmt in EXPORT_MIMETYPES:
+        return with_validators(export_results(session['user_id'], fmt), etag, last_modified)
+
+    cursor = request.args.get('cursor')
+    position = decode_cursor(cursor) if cursor else None
+    if cursor and position is None:
+        return jsonify({'error': 'Invalid cursor'}), 400
+    # Paged only when asked for; a bare request still gets the full history
+    limit = request.args.get('limit', type=int)
+    if cursor or limit is not None:
+        if limit is None:
+            limit = current_app.config['RESULTS_PAGE_SIZE']
+        limit = max(1, min(limit, current_app.config['RESULTS_MAX_PAGE_SIZE']))
+
+    results, next_cursor = result_page(session['user_id'], position, limit)
+    response = jsonify([
         {
             'timestamp': r.timestamp.strftime('%Y-%m-%d %H:%M'),
             'right_eye_score': r.right_eye_score,
             'left_eye_score': r.left_eye_score
         } for r in results
     ])
+    # The body stays a plain list; the next page is advertised in headers.
+    if next_cursor:
+        next_url = url_for('.my_results', cursor=next_cursor, limit=limit)
+        response.headers['Link'] = f'<{next_url}>; rel="next"'
+        response.headers['X-Next-Cursor'] = next_cursor
+    return with_validators(response, etag, last_modified)
+
+
+# ==================== RESULT EXPORT ====================
+EXPORT_FIELDS = ('timestamp', 'right_eye_score', 'left_eye_score')
+EXPORT_MIMETYPES = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+
+def export_rows(user_id, batch_size):
+    # yield_per streams rows off the DB cursor batch by batch instead of
+    # materialising the whole history.
+    query = db.session.query(
+        VisionTestResult.timestamp,
+        VisionTestResult.right_eye_score,
+        VisionTestResult.left_eye_score
+    ).filter(VisionTestResult.user_id == user_id).order_by(
+        VisionTestResult.timestamp.desc(), VisionTestResult.id.desc()
+    ).yield_per(batch_size)
+    for timestamp, right_eye_score, left_eye_score in query:
+        yield timestamp.strftime('%Y-%m-%d %H:%M'), right_eye_score, left_eye_score
+
+
+def export_chunks(user_id, fmt, batch_size):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer) if fmt == 'csv' else None
+    if writer:
+        writer.writerow(EXPORT_FIELDS)
+    for count, row in enumerate(export_rows(user_id, batch_size), 1):
+        if writer:
+            writer.writerow(row)
+        else:
+            buffer.write(json.dumps(dict(zip(EXPORT_FIELDS, row))) + '\n')
+        if count % batch_size == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def export_results(user_id, fmt):
+    chunks = export_chunks(user_id, fmt, current_app.config['RESULTS_EXPORT_BATCH'])
+    response = Response(stream_with_context(chunks), mimetype=EXPORT_MIMETYPES[fmt])
+    if fmt == 'csv':
+        response.headers['Content-Disposition'] = 'attachment; filename=vision_results.csv'
+    return response
 
 
 # ==================== DUAL DEVICE SYNC ROUTES ====================
-@app.route('/controller')
+@bp.route('/controller')
 def controller():
     token = request.args.get('token')
+    if token and resolve_pairing_token(token) is None:
+        return "Invalid token", 403
     return render_template("controller.html", token=token)
 
-@app.route('/test-display')
+@bp.route('/test-display')
 def test_display():
     token = request.args.get('token')
+    if token:
+        identity = resolve_pairing_token(token)
+        if identity is None:
+            return "Invalid token", 403
+        if identity[0] == session.get('user_id'):
+            session['pairing_token'] = token
     return render_template("test_display.html", token=token)
 
-@app.route('/mark_ready/<token>', methods=['POST'])
+def wait_seconds():
+    wait = request.args.get('wait', 0, type=float)
+    return max(0.0, min(wait, current_app.config['LONG_POLL_MAX_SECONDS']))
+
+
+def long_poll(token, poll, timeout):
+    # Re-run poll() each time the token's state changes until it returns
+    # something truthy or the timeout expires. timeout=0 polls once.
+    deadline = time.monotonic() + timeout
+    while True:
+        version = pairing_store.version(token)
+        result = poll()
+        remaining = deadline - time.monotonic()
+        if result or remaining <= 0:
+            return result
+        pairing_store.wait_for_change(token, version, remaining)
+
+
+@bp.route('/mark_ready/<token>', methods=['POST'])
 def mark_ready(token):
-    session_ready[token] = True
+    pairing_store.mark_ready(token)
     return jsonify({'status': 'ready'})
 
-@app.route('/check_ready/<token>')
+@bp.route('/check_ready/<token>')
 def check_ready(token):
-    return jsonify({'ready': session_ready.get(token, False)})
+    ready = long_poll(token, lambda: pairing_store.is_ready(token), wait_seconds())
+    return jsonify({'ready': ready})
 
-@app.route('/submit_direction', methods=['POST'])
+@bp.route('/submit_direction', methods=['POST'])
 def submit_direction():
     data = request.get_json()
     token = data.get('token')
     direction = data.get('direction')
-    latest_directions[token] = direction
-    return jsonify({'status': 'received'})
+    if not token:
+        return jsonify({'error': 'Missing token'}), 400
+    seq = pairing_store.push_direction(token, direction)
+    if seq is None:
+        return jsonify({'error': 'Too many pending answers'}), 429
+    return jsonify({'status': 'received', 'seq': seq})
 
-@app.route('/get_direction')
+@bp.route('/get_direction')
 def get_direction():
     token = request.args.get('token')
-    direction = latest_directions.get(token)
-    latest_directions[token] = None
-    return jsonify({'direction': direction})
+    limit = request.args.get('max', 1, type=int)
+    limit = max(1, min(limit, current_app.config['PAIRING_QUEUE_SIZE']))
+    popped = long_poll(token, lambda: pairing_store.pop_directions(token, limit), wait_seconds())
+    answers = [{'seq': seq, 'direction': direction} for seq, direction in popped]
+    return jsonify({
+        'direction': answers[0]['direction'] if answers else None,
+        'directions': answers
+    })
+
+@bp.route('/direction_ack/<token>')
+def direction_ack(token):
+    seq, acked = pairing_store.direction_ack(token)
+    return jsonify({'seq': seq, 'acked': acked})
+
+
+# ==================== PAIRING STATE ====================
+@bp.route('/pairing/<token>/state')
+def pairing_state(token):
+    # One poll target for the dashboard, display and controller pages.
+    # ?consume=N also drains up to N queued answers, like /get_direction.
+    # ?wait=S holds the request until the version moves past ?since=V
+    # (default: the current version) or S seconds pass.
+    consume = request.args.get('consume', 0, type=int)
+    consume = max(0, min(consume, current_app.config['PAIRING_QUEUE_SIZE']))
+    wait = wait_seconds()
+    if wait:
+        since = request.args.get('since', type=int)
+        if since is None:
+            since = pairing_store.version(token)
+        pairing_store.wait_for_change(token, since, wait)
+    state = pairing_store.snapshot(token, consume)
+    finished = state['finished']
+    return jsonify({
+        'version': state['version'],
+        'ready': state['ready'],
+        'seq': state['seq'],
+        'acked': state['acked'],
+        'pending': state['pending'],
+        'directions': [
+            {'seq': seq, 'direction': direction} for seq, direction in state['directions']
+        ],
+        'finished': finished is not None,
+        'scores': score_payload(finished) if finished else None
+    })
+
+
+# ==================== PAIRING EVENT STREAM ====================
+PAIRING_EVENTS = ('ready', 'direction', 'finished')
+
+
+def sse_event(name, data):
+    return f"event: {name}\ndata: {json.dumps(data)}\n\n"
+
+
+def pairing_event_stream(store, token, events, max_seconds, keepalive):
+    # Runs after the view has returned, outside the app context, so it is
+    # handed the app's store instead of reading the pairing_store proxy
+    deadline = time.monotonic() + max_seconds
+    was_ready = False
+    yield 'retry: 1000\n\n'
+    while True:
+        version = store.version(token)
+
+        if 'ready' in events:
+            ready = store.is_ready(token)
+            if ready and not was_ready:
+                yield sse_event('ready', {'ready': True})
+            was_ready = ready
+
+        if 'direction' in events:
+            for seq, direction in store.pop_directions(token):
+                yield sse_event('direction', {'seq': seq, 'direction': direction})
+
+        if 'finished' in events:
+            finished = store.get_finished(token)
+            if finished:
+                yield sse_event('finished', finished_payload(finished))
+                return
+
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return  # EventSource reconnects on its own
+        if store.wait_for_change(token, version, min(keepalive, remaining)) == version:
+            yield ': keepalive\n\n'
+
+
+@bp.route('/pairing/<token>/events')
+def pairing_events(token):
+    if not current_app.config['PAIRING_STREAM_ENABLED']:
+        return jsonify({'error': 'Streaming disabled'}), 404
+
+    requested = request.args.get('events')
+    events = set(requested.split(',')) if requested else set(PAIRING_EVENTS)
+    if not events <= set(PAIRING_EVENTS):
+        return jsonify({'error': 'Unknown event type'}), 400
+
+    stream = pairing_event_stream(
+        services().pairing_store,
+        token,
+        events,
+        current_app.config['PAIRING_STREAM_SECONDS'],
+        current_app.config['PAIRING_KEEPALIVE_SECONDS']
+    )
+    return Response(stream, mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+# ==================== METRICS ====================
+# Gauges are read by the registry's own app, bound in create_app()
+def pairing_store_gauge(services):
+    stats = services.pairing_store.stats()
+    return {(('kind', 'tokens'),): stats['entries'], (('kind', 'codes'),): stats['codes']}
+
+
+def cache_entries_gauge(services):
+    return {
+        (('cache', 'qr'),): len(services.qr_cache),
+        (('cache', 'dashboard'),): len(services.dashboard_cache),
+        (('cache', 'identity'),): len(services.identity_cache),
+    }
+
+
+def result_queue_gauge(services):
+    return services.result_queue.stats()['queued']
+
+
+def label_request_endpoint():
+    # View names without the blueprint prefix, as the fast path reports them
+    endpoint = request.endpoint
+    request.environ[ENDPOINT_KEY] = endpoint.rpartition('.')[2] if endpoint else UNMATCHED
+
+
+def metrics():
+    # With METRICS_TOKEN set, scrapers must send it as a bearer token
+    token = current_app.config['METRICS_TOKEN']
+    if token and not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return jsonify({'error': 'Unauthorized'}), 401
+    return Response(metrics_registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
 
 # ==================== VISUAL ACUITY CALCULATION ====================
 def calculate_visual_acuity(score, max_score=8):
@@ -320,10 +963,171 @@ def calculate_visual_acuity(score, max_score=8):
     return acuity_scale.get(score, "Unknown")
 
 
+# ==================== RECOMMENDATIONS ====================
+RECOMMENDATIONS = {
+    'exam': "⚠️ Schedule a full eye exam. Your results suggest significant vision challenges.",
+    'optometrist': "👓 Consider seeing an optometrist for corrective lenses.",
+    'reduced': "Your vision may be slightly reduced. Try reading in better light.",
+    'excellent': "✅ Your vision is excellent. Keep up with regular checks!",
+    'monitor': "Monitor your vision and retake the test in 1 month.",
+}
+
+
+def recommendation_tier(right_eye_score, left_eye_score):
+    if right_eye_score <= 3 or left_eye_score <= 3:
+        return 'exam'
+    elif right_eye_score < 5 or left_eye_score < 5:
+        return 'optometrist'
+    elif right_eye_score < 7 or left_eye_score < 7:
+        return 'reduced'
+    elif right_eye_score >= 7 and left_eye_score >= 7:
+        return 'excellent'
+    return 'monitor'
+
+
+# ==================== CONFIGURATION ====================
+def load_config(app):
+    app.secret_key = os.getenv('SECRET_KEY', 'fallback-secret')  # fallback is optional
+    app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('SQLALCHEMY_DATABASE_URI', 'sqlite:///vision_test.db')
+    # SQLite tuning, see db_profile.py; SQLITE_PROFILE=default turns it off
+    app.config['SQLITE_PROFILE'] = os.getenv('SQLITE_PROFILE', 'production')
+    app.config['SQLITE_BUSY_TIMEOUT_MS'] = int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', 5000))
+    app.config['SQLITE_MMAP_BYTES'] = int(os.getenv('SQLITE_MMAP_BYTES', 256 * 1024 * 1024))
+    app.config['SQLITE_CACHE_KIB'] = int(os.getenv('SQLITE_CACHE_KIB', 16384))
+    app.config['SQLITE_POOL_SIZE'] = int(os.getenv('SQLITE_POOL_SIZE', 8))
+    app.config['SQLITE_POOL_OVERFLOW'] = int(os.getenv('SQLITE_POOL_OVERFLOW', 16))
+    app.config['SQLITE_POOL_TIMEOUT_SECONDS'] = int(os.getenv('SQLITE_POOL_TIMEOUT_SECONDS', 10))
+    # Per-request query counts, slow-query log, N+1 warnings and Server-Timing
+    app.config['SQL_SLOW_QUERY_MS'] = float(os.getenv('SQL_SLOW_QUERY_MS', 100))
+    app.config['SQL_N_PLUS_ONE_THRESHOLD'] = int(os.getenv('SQL_N_PLUS_ONE_THRESHOLD', 5))
+    app.config['SQL_N_PLUS_ONE_WARN'] = os.getenv('SQL_N_PLUS_ONE_WARN', '0') == '1'
+    app.config['SERVER_TIMING_ENABLED'] = os.getenv('SERVER_TIMING_ENABLED', '1') == '1'
+
+    # In-memory sync state
+    app.config['PAIRING_MAX_ENTRIES'] = int(os.getenv('PAIRING_MAX_ENTRIES', 10000))
+    app.config['PAIRING_TTL_SECONDS'] = int(os.getenv('PAIRING_TTL_SECONDS', 3600))
+    app.config['PAIRING_QUEUE_SIZE'] = int(os.getenv('PAIRING_QUEUE_SIZE', 16))
+    # Lifetime of the short pairing codes embedded in the dashboard QR code
+    app.config['PAIRING_CODE_TTL_SECONDS'] = int(os.getenv('PAIRING_CODE_TTL_SECONDS', 900))
+    # 'memory' is per-process; use 'sqlite' when running more than one worker
+    app.config['PAIRING_BACKEND'] = os.getenv('PAIRING_BACKEND', 'memory')
+    app.config['PAIRING_SQLITE_PATH'] = os.getenv(
+        'PAIRING_SQLITE_PATH', os.path.join(app.instance_path, 'pairing_state.db')
+    )
+    # Server-Sent Events for the display/controller pages; when disabled the
+    # pages fall back to polling the JSON endpoints.
+    app.config['PAIRING_STREAM_ENABLED'] = os.getenv('PAIRING_STREAM_ENABLED', '1') == '1'
+    app.config['PAIRING_STREAM_SECONDS'] = int(os.getenv('PAIRING_STREAM_SECONDS', 55))
+    app.config['PAIRING_KEEPALIVE_SECONDS'] = 15
+    # Upper bound for ?wait=<seconds> long polls on the sync endpoints
+    app.config['LONG_POLL_MAX_SECONDS'] = float(os.getenv('LONG_POLL_MAX_SECONDS', 25))
+    # /mark_ready, /submit_direction and short polls are answered by a plain
+    # WSGI dispatcher in front of Flask; long polls and everything else fall through.
+    app.config['PAIRING_FAST_PATH'] = os.getenv('PAIRING_FAST_PATH', '1') == '1'
+
+    # Encoded QR images keyed by the URL they encode; the URL only depends on
+    # the user's token and the host, so repeat dashboard visits reuse them.
+    app.config['QR_CACHE_ENTRIES'] = int(os.getenv('QR_CACHE_ENTRIES', 1024))
+    app.config['QR_CACHE_BYTES'] = int(os.getenv('QR_CACHE_BYTES', 4 * 1024 * 1024))
+    # Defaults for the compact PNG; each can be overridden per request
+    app.config['QR_ERROR_CORRECTION'] = os.getenv('QR_ERROR_CORRECTION', 'M')
+    app.config['QR_BORDER'] = int(os.getenv('QR_BORDER', 4))
+    app.config['QR_BOX_SIZE'] = int(os.getenv('QR_BOX_SIZE', 6))
+
+    # Rendered history/recommendation cards, keyed by (user_id, cursor)
+    app.config['DASHBOARD_CACHE_ENTRIES'] = int(os.getenv('DASHBOARD_CACHE_ENTRIES', 1024))
+    app.config['DASHBOARD_CACHE_BYTES'] = int(os.getenv('DASHBOARD_CACHE_BYTES', 8 * 1024 * 1024))
+
+    app.config['RESULTS_PAGE_SIZE'] = int(os.getenv('RESULTS_PAGE_SIZE', 100))
+    app.config['RESULTS_MAX_PAGE_SIZE'] = int(os.getenv('RESULTS_MAX_PAGE_SIZE', 500))
+    app.config['DASHBOARD_PAGE_SIZE'] = int(os.getenv('DASHBOARD_PAGE_SIZE', 20))
+    # Rows fetched per round trip (and per streamed chunk) by /my_results exports
+    app.config['RESULTS_EXPORT_BATCH'] = int(os.getenv('RESULTS_EXPORT_BATCH', 500))
+
+    # Users cannot edit these fields, so a short TTL only bounds how long a
+    # deleted account keeps resolving.
+    app.config['IDENTITY_CACHE_ENTRIES'] = int(os.getenv('IDENTITY_CACHE_ENTRIES', 4096))
+    app.config['IDENTITY_CACHE_SECONDS'] = int(os.getenv('IDENTITY_CACHE_SECONDS', 300))
+
+    # Hashing runs in a small process pool so a burst of logins cannot starve
+    # the request threads serving the polling endpoints. Changing the method
+    # re-hashes each user's password at their next successful login.
+    app.config['PASSWORD_HASH_METHOD'] = os.getenv('PASSWORD_HASH_METHOD', 'scrypt')
+    app.config['PASSWORD_HASH_WORKERS'] = int(os.getenv('PASSWORD_HASH_WORKERS', 2))
+    app.config['PASSWORD_HASH_MAX_PENDING'] = int(os.getenv('PASSWORD_HASH_MAX_PENDING', 32))
+    app.config['PASSWORD_HASH_TIMEOUT_SECONDS'] = int(os.getenv('PASSWORD_HASH_TIMEOUT_SECONDS', 10))
+
+    # 'sync' commits each result inside its request; 'batched' hands results to a
+    # background writer that group-commits them. With RESULT_WRITE_ACK=durable a
+    # batched request still waits for its commit, 'queued' answers 202 at once.
+    app.config['RESULT_WRITE_MODE'] = os.getenv('RESULT_WRITE_MODE', 'sync')
+    app.config['RESULT_WRITE_ACK'] = os.getenv('RESULT_WRITE_ACK', 'durable')
+    app.config['RESULT_WRITE_QUEUE_SIZE'] = int(os.getenv('RESULT_WRITE_QUEUE_SIZE', 1024))
+    app.config['RESULT_WRITE_BATCH_SIZE'] = int(os.getenv('RESULT_WRITE_BATCH_SIZE', 64))
+    app.config['RESULT_WRITE_FLUSH_MS'] = int(os.getenv('RESULT_WRITE_FLUSH_MS', 20))
+    app.config['RESULT_WRITE_TIMEOUT_SECONDS'] = int(os.getenv('RESULT_WRITE_TIMEOUT_SECONDS', 10))
+
+    # Prometheus text exposition at /metrics; the middleware wraps the fast path
+    # too, so its endpoints are counted under the same names as the Flask views.
+    # Off by default: the page lists endpoints, traffic and store sizes.
+    app.config['METRICS_ENABLED'] = os.getenv('METRICS_ENABLED', '0') == '1'
+    app.config['METRICS_TOKEN'] = os.getenv('METRICS_TOKEN', '')
+
+# ==================== APPLICATION FACTORY ====================
+def create_app(config=None):
+    """Build the app; ``config`` overrides the environment-derived settings.
+
+    Importing this module only defines models and views. The database engine,
+    caches, worker pools and middleware are set up here, and the QR imaging
+    stack is not loaded until the first /generate_qr.
+    """
+    app = Flask(__name__)
+    load_config(app)
+    app.config.update(config or {})
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', sqlite_engine_options(app.config))
+
+    app.register_blueprint(bp)
+    db.init_app(app)
+    with app.app_context():
+        install_sqlite_profile(db.engine, app.config)
+        install_query_instrumentation(app, db.engine)
+    CORS(app, supports_credentials=True)
+
+    state = app.extensions[SERVICES_KEY] = Services(app)
+    atexit.register(state.close)
+
+    if app.config['PAIRING_FAST_PATH']:
+        app.wsgi_app = PairingFastPath(
+            app.wsgi_app, state.pairing_store, app.config['PAIRING_QUEUE_SIZE'], score_payload
+        )
+
+    registry = state.metrics_registry
+    registry.gauge('pairing_store_size', 'Live pairing tokens and codes.', partial(pairing_store_gauge, state))
+    registry.gauge('cache_entries', 'Entries held by each in-process cache.', partial(cache_entries_gauge, state))
+    registry.gauge(
+        'result_write_queue_depth', 'Results waiting for the batched writer.', partial(result_queue_gauge, state)
+    )
+    if app.config['METRICS_ENABLED']:
+        app.wsgi_app = MetricsMiddleware(app.wsgi_app, registry)
+        app.before_request(label_request_endpoint)
+        app.add_url_rule('/metrics', view_func=metrics)
+
+    return app
+
+
+def __getattr__(name):
+    # `main:app` (flask --app main, WSGI servers) builds the app on first use
+    if name == 'app':
+        app = globals()['app'] = create_app()
+        return app
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
+
 # ==================== RUN ====================
 if __name__ == '__main__':
+    app = create_app()
     with app.app_context():
-        db.create_all()
+        upgrade_db()
     app.run(host='0.0.0.0', port=5050, debug=True)
 
 
@@ -0,0 +1,137 @@
+import threading
+import time
+from bisect import bisect_left
+
+
+# Log-linear bucket bounds in seconds (1, 1.5, 2, 3, 5, 7.5 per decade from
+# 100us to 75s): a fixed ~11% resolution at every scale, HDR-histogram style.
+LATENCY_BUCKETS = tuple(
+    round(mantissa * 10 ** exponent, 6)
+    for exponent in range(-4, 2)
+    for mantissa in (1, 1.5, 2, 3, 5, 7.5)
+)
+
+ENDPOINT_KEY = 'metrics.endpoint'
+UNMATCHED = 'unmatched'
+METHODS = frozenset(('GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'))
+
+
+# ==================== REGISTRY ====================
+class MetricsRegistry:
+    """Fixed-size latency histograms per (endpoint, method, status).
+
+    Label values come from route endpoint names rather than raw paths, so
+    the number of series is bounded by the route table.
+    """
+
+    def __init__(self, prefix='visioncare', buckets=LATENCY_BUCKETS):
+        self.prefix = prefix
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._histograms = {}  # (endpoint, method, status) -> [counts..., sum]
+        self._in_flight = 0
+        self._gauges = []      # (name, help, callback returning {labels: value})
+
+    def observe(self, endpoint, method, status, seconds, finished=0):
+        # ``finished`` also retires that many in-flight requests under the same lock
+        index = bisect_left(self.buckets, seconds)
+        key = (endpoint, method, status)
+        with self._lock:
+            self._in_flight -= finished
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [0] * (len(self.buckets) + 2)
+            histogram[index] += 1
+            histogram[-1] += seconds
+
+    def track_in_flight(self, delta):
+        with self._lock:
+            self._in_flight += delta
+
+    def gauge(self, name, help_text, callback):
+        """Register a gauge read at scrape time; ``callback`` returns a number
+        or a dict mapping label tuples ``(('name', 'value'), ...)`` to numbers."""
+        self._gauges.append((name, help_text, callback))
+
+    # -------------------- exposition --------------------
+    def render(self):
+        with self._lock:
+            histograms = {key: list(counts) for key, counts in self._histograms.items()}
+            in_flight = self._in_flight
+
+        duration = f'{self.prefix}_http_request_duration_seconds'
+        total = f'{self.prefix}_http_requests_total'
+        lines = [
+            f'# HELP {duration} Time until the response headers were ready.',
+            f'# TYPE {duration} histogram',
+        ]
+        requests = []
+        for (endpoint, method, status), counts in sorted(histograms.items()):
+            labels = f'endpoint="{endpoint}",method="{method}",status="{status}"'
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                lines.append(f'{duration}_bucket{{{labels},le="{bound}"}} {cumulative}')
+            cumulative += counts[len(self.buckets)]
+            lines.append(f'{duration}_bucket{{{labels},le="+Inf"}} {cumulative}')
+            lines.append(f'{duration}_sum{{{labels}}} {counts[-1]:.6f}')
+            lines.append(f'{duration}_count{{{labels}}} {cumulative}')
+            requests.append(f'{total}{{{labels}}} {cumulative}')
+
+        lines += [f'# HELP {total} Requests handled.', f'# TYPE {total} counter', *requests]
+
+        name = f'{self.prefix}_http_requests_in_flight'
+        lines += [f'# HELP {name} Requests currently being handled.', f'# TYPE {name} gauge']
+        lines.append(f'{name} {in_flight}')
+
+        for name, help_text, callback in self._gauges:
+            name = f'{self.prefix}_{name}'
+            lines += [f'# HELP {name} {help_text}', f'# TYPE {name} gauge']
+            values = callback()
+            if not isinstance(values, dict):
+                values = {(): values}
+            for labels, value in values.items():
+                label_text = ','.join(f'{k}="{v}"' for k, v in labels)
+                lines.append(f'{name}{{{label_text}}} {value}' if label_text else f'{name} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+# ==================== WSGI MIDDLEWARE ====================
+class MetricsMiddleware:
+    """Times each request until its response headers are sent.
+
+    The endpoint label is read from ``environ['metrics.endpoint']``, which the
+    Flask app and the pairing fast path set once they know the route. Streaming
+    bodies (SSE, exports) are timed up to their headers, not their full length.
+    """
+
+    def __init__(self, app, registry, clock=time.perf_counter):
+        self.app = app
+        self.registry = registry
+        self.clock = clock
+
+    def __call__(self, environ, start_response):
+        started = self.clock()
+        method = environ.get('REQUEST_METHOD', 'GET')
+        if method not in METHODS:
+            method = 'other'
+        registry = self.registry
+        registry.track_in_flight(1)
+        state = {'done': False}
+
+        def finish(status):
+            if state['done']:
+                return
+            state['done'] = True
+            endpoint = environ.get(ENDPOINT_KEY) or UNMATCHED
+            registry.observe(endpoint, method, status, self.clock() - started, finished=1)
+
+        def timed_start_response(status, headers, exc_info=None):
+            finish(status.split(' ', 1)[0])
+            return start_response(status, headers, exc_info)
+
+        try:
+            return self.app(environ, timed_start_response)
+        except Exception:
+            finish('500')
+            raise
@@ -0,0 +1,674 @@
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+
+
+# ==================== PAIRING RECORD ====================
+class PairingRecord:
+    __slots__ = ('ready', 'directions', 'last_seq', 'acked_seq', 'finished', 'touched', 'version')
+
+    def __init__(self, now):
+        self.ready = False
+        self.directions = None  # deque of (seq, direction), created on first answer
+        self.last_seq = 0
+        self.acked_seq = 0
+        self.finished = None
+        self.touched = now
+        self.version = 0
+
+
+# ==================== PAIRING STATE STORE ====================
+class PairingStateStore:
+    """Per-token sync state shared by the laptop display and the phone controller.
+
+    Records are kept in least-recently-used order. A record is dropped once it
+    has been idle for ``ttl`` seconds, or when the store grows past
+    ``max_entries`` (oldest first). Reads never create records, so polling
+    with an unknown token costs nothing.
+
+    Every change stamps the record with a store-wide, monotonically increasing
+    version. ``wait_for_change`` blocks on a condition variable created for
+    that token only while someone is waiting, so a change wakes just the
+    requests interested in it.
+
+    Controller answers are queued per token with sequence numbers. At most
+    ``queue_size`` answers may be pending, and popping an answer acknowledges
+    it by advancing ``acked_seq``.
+
+    The store also maps short pairing codes to the user they were issued for.
+    Codes expire ``code_ttl`` seconds after being issued.
+    """
+
+    def __init__(self, max_entries=10000, ttl=3600, queue_size=16, code_ttl=900,
+                 clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.queue_size = queue_size
+        self.code_ttl = code_ttl
+        self._clock = clock
+        self._records = OrderedDict()
+        self._codes = OrderedDict()  # code -> (user_id, user_uuid, expires), oldest first
+        self._user_codes = {}  # user_id -> newest code
+        self._lock = threading.Lock()
+        self._waiters = {}  # token -> [Condition, number of waiting threads]
+        self._version = 0
+        self.expired = 0
+        self.evicted = 0
+
+    def __len__(self):
+        return len(self._records)
+
+    # ---- internal helpers (caller must hold self._lock) ----
+    def _expire(self, now):
+        cutoff = now - self.ttl
+        records = self._records
+        while records:
+            token = next(iter(records))
+            if records[token].touched > cutoff:
+                break
+            del records[token]
+            self.expired += 1
+
+    def _get(self, token, create=False):
+        now = self._clock()
+        self._expire(now)
+        record = self._records.get(token)
+        if record is not None:
+            record.touched = now
+            self._records.move_to_end(token)
+        elif create:
+            record = PairingRecord(now)
+            self._records[token] = record
+            while len(self._records) > self.max_entries:
+                self._records.popitem(last=False)
+                self.evicted += 1
+        return record
+
+    def _bump(self, token, record):
+        self._version += 1
+        record.version = self._version
+        waiter = self._waiters.get(token)
+        if waiter is not None:
+            waiter[0].notify_all()
+
+    def _current_version(self, token):
+        record = self._records.get(token)
+        return 0 if record is None else record.version
+
+    # ---- change tracking ----
+    def version(self, token):
+        with self._lock:
+            record = self._get(token)
+            return 0 if record is None else record.version
+
+    def wait_for_change(self, token, version, timeout):
+        """Block until ``token``'s version differs from ``version``; return the new one."""
+        with self._lock:
+            waiter = self._waiters.get(token)
+            if waiter is None:
+                waiter = self._waiters[token] = [threading.Condition(self._lock), 0]
+            waiter[1] += 1
+            try:
+                waiter[0].wait_for(
+                    lambda: self._current_version(token) != version, timeout
+                )
+                return self._current_version(token)
+            finally:
+                waiter[1] -= 1
+                if not waiter[1]:
+                    del self._waiters[token]
+
+    # ---- readiness ----
+    def mark_ready(self, token):
+        with self._lock:
+            record = self._get(token, create=True)
+            record.ready = True
+            self._bump(token, record)
+
+    def reset_ready(self, token):
+        with self._lock:
+            record = self._get(token)
+            if record is not None and record.ready:
+                record.ready = False
+                self._bump(token, record)
+
+    def is_ready(self, token):
+        with self._lock:
+            record = self._get(token)
+            return record is not None and record.ready
+
+    # ---- directions ----
+    def push_direction(self, token, direction):
+        """Queue an answer and return its sequence number, or None if the queue is full."""
+        with self._lock:
+            record = self._get(token, create=True)
+            if record.directions is None:
+                record.directions = deque()
+            elif len(record.directions) >= self.queue_size:
+                return None
+            record.last_seq += 1
+            record.directions.append((record.last_seq, direction))
+            self._bump(token, record)
+            return record.last_seq
+
+    def _pop_directions(self, token, record, limit):
+        queue = record.directions
+        if not queue:
+            return []
+        count = len(queue) if limit is None else min(limit, len(queue))
+        answers = [queue.popleft() for _ in range(count)]
+        record.acked_seq = answers[-1][0]
+        self._bump(token, record)
+        return answers
+
+    def pop_directions(self, token, limit=None):
+        """Remove and acknowledge up to ``limit`` pending answers, oldest first."""
+        with self._lock:
+            record = self._get(token)
+            if record is None:
+                return []
+            return self._pop_directions(token, record, limit)
+
+    def direction_ack(self, token):
+        with self._lock:
+            record = self._get(token)
+            if record is None:
+                return 0, 0
+            return record.last_seq, record.acked_seq
+
+    # ---- combined view ----
+    def snapshot(self, token, consume=0):
+        """Return the whole record in one locked read, first popping up to ``consume`` answers."""
+        with self._lock:
+            record = self._get(token)
+            if record is None:
+                return empty_snapshot()
+            answers = self._pop_directions(token, record, consume) if consume else []
+            finished = record.finished
+            return {
+                'version': record.version,
+                'ready': record.ready,
+                'seq': record.last_seq,
+                'acked': record.acked_seq,
+                'pending': len(record.directions or ()),
+                'directions': answers,
+                'finished': None if finished is None else {
+                    'right_eye': finished[0], 'left_eye': finished[1]
+                },
+            }
+
+    # ---- finished tests ----
+    def set_finished(self, token, right_eye, left_eye):
+        with self._lock:
+            record = self._get(token, create=True)
+            record.finished = (right_eye, left_eye)
+            self._bump(token, record)
+
+    def get_finished(self, token):
+        with self._lock:
+            record = self._get(token)
+            if record is None or record.finished is None:
+                return None
+            right_eye, left_eye = record.finished
+            return {'right_eye': right_eye, 'left_eye': left_eye}
+
+    def clear_finished(self, token):
+        with self._lock:
+            record = self._get(token)
+            if record is not None and record.finished is not None:
+                record.finished = None
+                self._bump(token, record)
+
+    # ---- pairing codes ----
+    def _expire_codes(self, now):
+        codes = self._codes
+        while codes:
+            code = next(iter(codes))
+            user_id, _, expires = codes[code]
+            if expires > now and len(codes) <= self.max_entries:
+                break
+            del codes[code]
+            if self._user_codes.get(user_id) == code:
+                del self._user_codes[user_id]
+
+    def issue_code(self, user_id, user_uuid):
+        """Return the user's current code, or a fresh one once it is past half its lifetime."""
+        with self._lock:
+            now = self._clock()
+            self._expire_codes(now)
+            code = self._user_codes.get(user_id)
+            if code is not None and self._codes[code][2] - now > self.code_ttl / 2:
+                return code
+            code = new_pairing_code()
+            self._codes[code] = (user_id, user_uuid, now + self.code_ttl)
+            self._user_codes[user_id] = code
+            self._expire_codes(now)
+            return code
+
+    def resolve_code(self, code):
+        """Return ``(user_id, user_uuid)`` for a live code, else None."""
+        with self._lock:
+            entry = self._codes.get(code)
+            if entry is None or entry[2] <= self._clock():
+                return None
+            return entry[0], entry[1]
+
+    def user_code(self, user_id):
+        with self._lock:
+            code = self._user_codes.get(user_id)
+            if code is None or self._codes[code][2] <= self._clock():
+                return None
+            return code
+
+    # ---- housekeeping ----
+    def purge_expired(self):
+        with self._lock:
+            now = self._clock()
+            self._expire(now)
+            self._expire_codes(now)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._records),
+                'codes': len(self._codes),
+                'max_entries': self.max_entries,
+                'ttl': self.ttl,
+                'queue_size': self.queue_size,
+                'expired': self.expired,
+                'evicted': self.evicted,
+            }
+
+
+# ==================== SQLITE BACKEND ====================
+class SQLitePairingStateStore:
+    """Pairing state kept in a SQLite WAL table so every worker on a host shares it.
+
+    Same interface as PairingStateStore. Expired rows are invisible to reads
+    and are deleted in batches every ``purge_interval`` seconds, which is also
+    when the ``max_entries`` cap is enforced. Reads refresh a row's
+    ``touched`` time at most once per ``touch_interval`` seconds so polling
+    does not turn into a write per request.
+
+    Versions come from a counter row shared by all processes. Condition
+    variables cannot span processes, so ``wait_for_change`` re-reads the
+    version every ``poll_interval`` seconds.
+
+    The state is transient, so a file written with an older schema
+    (``PRAGMA user_version``) is simply dropped and recreated.
+    """
+
+    SCHEMA_VERSION = 3
+    SCHEMA = (
+        'CREATE TABLE IF NOT EXISTS pairing_state ('
+        ' token TEXT PRIMARY KEY,'
+        ' ready INTEGER NOT NULL DEFAULT 0,'
+        ' last_seq INTEGER NOT NULL DEFAULT 0,'
+        ' acked_seq INTEGER NOT NULL DEFAULT 0,'
+        ' right_eye INTEGER,'
+        ' left_eye INTEGER,'
+        ' touched REAL NOT NULL,'
+        ' version INTEGER NOT NULL DEFAULT 0'
+        ')',
+        'CREATE INDEX IF NOT EXISTS ix_pairing_state_touched ON pairing_state (touched)',
+        'CREATE TABLE IF NOT EXISTS pairing_direction ('
+        ' token TEXT NOT NULL,'
+        ' seq INTEGER NOT NULL,'
+        ' direction TEXT,'
+        ' PRIMARY KEY (token, seq)'
+        ') WITHOUT ROWID',
+        'CREATE TABLE IF NOT EXISTS pairing_code ('
+        ' code TEXT PRIMARY KEY,'
+        ' user_id INTEGER NOT NULL,'
+        ' user_uuid TEXT NOT NULL,'
+        ' expires REAL NOT NULL'
+        ')',
+        'CREATE INDEX IF NOT EXISTS ix_pairing_code_user ON pairing_code (user_id, expires)',
+        'CREATE TABLE IF NOT EXISTS pairing_meta (name TEXT PRIMARY KEY, value INTEGER NOT NULL)',
+        "INSERT OR IGNORE INTO pairing_meta (name, value) VALUES ('version', 0)",
+    )
+    NEXT_VERSION = "version = (SELECT value FROM pairing_meta WHERE name = 'version')"
+
+    def __init__(self, path, max_entries=10000, ttl=3600, queue_size=16, code_ttl=900,
+                 clock=time.time, purge_interval=30, touch_interval=60, busy_timeout=5.0,
+                 poll_interval=0.05):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.queue_size = queue_size
+        self.code_ttl = code_ttl
+        self.purge_interval = purge_interval
+        self.touch_interval = touch_interval
+        self.poll_interval = poll_interval
+        self.busy_timeout = busy_timeout
+        self._clock = clock
+        self._local = threading.local()
+        self._next_purge = 0
+        self.expired = 0
+        self.evicted = 0
+
+        conn = self._conn()
+        conn.execute('PRAGMA journal_mode=WAL')
+        with self._write() as conn:
+            if conn.execute('PRAGMA user_version').fetchone()[0] != self.SCHEMA_VERSION:
+                conn.execute('DROP TABLE IF EXISTS pairing_state')
+                conn.execute('DROP TABLE IF EXISTS pairing_direction')
+                conn.execute('DROP TABLE IF EXISTS pairing_code')
+            for statement in self.SCHEMA:
+                conn.execute(statement)
+            conn.execute(f'PRAGMA user_version = {self.SCHEMA_VERSION}')
+
+    def __len__(self):
+        cutoff = self._clock() - self.ttl
+        row = self._conn().execute(
+            'SELECT COUNT(*) FROM pairing_state WHERE touched > ?', (cutoff,)
+        ).fetchone()
+        return row[0]
+
+    # ---- connection handling ----
+    def _conn(self):
+        # One connection per thread, reopened after a fork (gunicorn --preload).
+        local = self._local
+        if getattr(local, 'pid', None) != os.getpid():
+            conn = sqlite3.connect(
+                self.path,
+                timeout=self.busy_timeout,
+                isolation_level=None,
+                check_same_thread=False
+            )
+            conn.execute('PRAGMA synchronous=NORMAL')
+            local.conn = conn
+            local.pid = os.getpid()
+        return local.conn
+
+    @contextmanager
+    def _write(self):
+        conn = self._conn()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield conn
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+        if self._clock() >= self._next_purge:
+            self.purge_expired()
+
+    def _drop_if_expired(self, conn, token, now):
+        cursor = conn.execute(
+            'DELETE FROM pairing_state WHERE token = ? AND touched <= ?',
+            (token, now - self.ttl)
+        )
+        if cursor.rowcount:
+            self.expired += cursor.rowcount
+            conn.execute('DELETE FROM pairing_direction WHERE token = ?', (token,))
+
+    def _bump(self, conn, token, assignments, params=(), now=None):
+        conn.execute("UPDATE pairing_meta SET value = value + 1 WHERE name = 'version'")
+        conn.execute(
+            f'UPDATE pairing_state SET {assignments}, touched = ?, {self.NEXT_VERSION} '
+            'WHERE token = ?',
+            (*params, self._clock() if now is None else now, token)
+        )
+
+    def _ensure_row(self, conn, token, now):
+        self._drop_if_expired(conn, token, now)
+        conn.execute(
+            'INSERT INTO pairing_state (token, touched) VALUES (?, ?) '
+            'ON CONFLICT (token) DO NOTHING',
+            (token, now)
+        )
+
+    def _upsert(self, token, assignments, params):
+        now = self._clock()
+        with self._write() as conn:
+            self._ensure_row(conn, token, now)
+            self._bump(conn, token, assignments, params, now)
+
+    def _read(self, columns, token):
+        now = self._clock()
+        conn = self._conn()
+        row = conn.execute(
+            f'SELECT touched, {columns} FROM pairing_state WHERE token = ? AND touched > ?',
+            (token, now - self.ttl)
+        ).fetchone()
+        if row is None:
+            return None
+        if now - row[0] >= self.touch_interval:
+            conn.execute(
+                'UPDATE pairing_state SET touched = ? WHERE token = ?', (now, token)
+            )
+        return row[1:]
+
+    # ---- change tracking ----
+    def version(self, token):
+        row = self._read('version', token)
+        return 0 if row is None else row[0]
+
+    def wait_for_change(self, token, version, timeout):
+        deadline = time.monotonic() + timeout
+        while True:
+            current = self.version(token)
+            remaining = deadline - time.monotonic()
+            if current != version or remaining <= 0:
+                return current
+            time.sleep(min(self.poll_interval, remaining))
+
+    # ---- readiness ----
+    def mark_ready(self, token):
+        self._upsert(token, 'ready = 1', ())
+
+    def reset_ready(self, token):
+        now = self._clock()
+        with self._write() as conn:
+            row = conn.execute(
+                'SELECT ready FROM pairing_state WHERE token = ? AND touched > ?',
+                (token, now - self.ttl)
+            ).fetchone()
+            if row is not None and row[0]:
+                self._bump(conn, token, 'ready = 0', now=now)
+
+    def is_ready(self, token):
+        row = self._read('ready', token)
+        return row is not None and bool(row[0])
+
+    # ---- directions ----
+    def push_direction(self, token, direction):
+        now = self._clock()
+        with self._write() as conn:
+            self._ensure_row(conn, token, now)
+            last_seq, acked_seq = conn.execute(
+                'SELECT last_seq, acked_seq FROM pairing_state WHERE token = ?', (token,)
+            ).fetchone()
+            if last_seq - acked_seq >= self.queue_size:
+                return None
+            seq = last_seq + 1
+            conn.execute(
+                'INSERT INTO pairing_direction (token, seq, direction) VALUES (?, ?, ?)',
+                (token, seq, direction)
+            )
+            self._bump(conn, token, 'last_seq = ?', (seq,), now)
+            return seq
+
+    def _pop_directions(self, conn, token, limit, now):
+        answers = conn.execute(
+            'SELECT seq, direction FROM pairing_direction WHERE token = ? AND EXISTS ('
+            ' SELECT 1 FROM pairing_state WHERE token = ? AND touched > ?'
+            ') ORDER BY seq LIMIT ?',
+            (token, token, now - self.ttl, -1 if limit is None else limit)
+        ).fetchall()
+        if not answers:
+            return []
+        acked_seq = answers[-1][0]
+        conn.execute(
+            'DELETE FROM pairing_direction WHERE token = ? AND seq <= ?', (token, acked_seq)
+        )
+        self._bump(conn, token, 'acked_seq = ?', (acked_seq,), now)
+        return answers
+
+    def pop_directions(self, token, limit=None):
+        now = self._clock()
+        with self._write() as conn:
+            return self._pop_directions(conn, token, limit, now)
+
+    def direction_ack(self, token):
+        row = self._read('last_seq, acked_seq', token)
+        return (0, 0) if row is None else row
+
+    # ---- combined view ----
+    def snapshot(self, token, consume=0):
+        columns = 'version, ready, last_seq, acked_seq, right_eye, left_eye'
+        if consume:
+            now = self._clock()
+            with self._write() as conn:
+                answers = self._pop_directions(conn, token, consume, now)
+                row = conn.execute(
+                    f'SELECT touched, {columns} FROM pairing_state WHERE token = ? AND touched > ?',
+                    (token, now - self.ttl)
+                ).fetchone()
+                row = None if row is None else row[1:]
+        else:
+            answers = []
+            row = self._read(columns, token)
+        if row is None:
+            return empty_snapshot()
+        version, ready, last_seq, acked_seq, right_eye, left_eye = row
+        return {
+            'version': version,
+            'ready': bool(ready),
+            'seq': last_seq,
+            'acked': acked_seq,
+            'pending': last_seq - acked_seq,
+            'directions': answers,
+            'finished': None if right_eye is None else {
+                'right_eye': right_eye, 'left_eye': left_eye
+            },
+        }
+
+    # ---- finished tests ----
+    def set_finished(self, token, right_eye, left_eye):
+        self._upsert(token, 'right_eye = ?, left_eye = ?', (right_eye, left_eye))
+
+    def get_finished(self, token):
+        row = self._read('right_eye, left_eye', token)
+        if row is None or row[0] is None:
+            return None
+        return {'right_eye': row[0], 'left_eye': row[1]}
+
+    def clear_finished(self, token):
+        now = self._clock()
+        with self._write() as conn:
+            row = conn.execute(
+                'SELECT right_eye FROM pairing_state WHERE token = ? AND touched > ?',
+                (token, now - self.ttl)
+            ).fetchone()
+            if row is not None and row[0] is not None:
+                self._bump(conn, token, 'right_eye = NULL, left_eye = NULL', now=now)
+
+    # ---- pairing codes ----
+    def issue_code(self, user_id, user_uuid):
+        now = self._clock()
+        with self._write() as conn:
+            row = conn.execute(
+                'SELECT code FROM pairing_code WHERE user_id = ? AND expires > ? '
+                'ORDER BY expires DESC LIMIT 1',
+                (user_id, now + self.code_ttl / 2)
+            ).fetchone()
+            if row is not None:
+                return row[0]
+            code = new_pairing_code()
+            conn.execute(
+                'INSERT INTO pairing_code (code, user_id, user_uuid, expires) VALUES (?, ?, ?, ?)',
+                (code, user_id, user_uuid, now + self.code_ttl)
+            )
+            return code
+
+    def resolve_code(self, code):
+        row = self._conn().execute(
+            'SELECT user_id, user_uuid FROM pairing_code WHERE code = ? AND expires > ?',
+            (code, self._clock())
+        ).fetchone()
+        return None if row is None else (row[0], row[1])
+
+    def user_code(self, user_id):
+        row = self._conn().execute(
+            'SELECT code FROM pairing_code WHERE user_id = ? AND expires > ? '
+            'ORDER BY expires DESC LIMIT 1',
+            (user_id, self._clock())
+        ).fetchone()
+        return None if row is None else row[0]
+
+    # ---- housekeeping ----
+    def purge_expired(self):
+        now = self._clock()
+        self._next_purge = now + self.purge_interval
+        conn = self._conn()
+        cursor = conn.execute(
+            'DELETE FROM pairing_state WHERE touched <= ?', (now - self.ttl,)
+        )
+        self.expired += cursor.rowcount
+        cursor = conn.execute(
+            'DELETE FROM pairing_state WHERE token IN ('
+            ' SELECT token FROM pairing_state ORDER BY touched DESC LIMIT -1 OFFSET ?'
+            ')',
+            (self.max_entries,)
+        )
+        self.evicted += cursor.rowcount
+        conn.execute(
+            'DELETE FROM pairing_direction WHERE token NOT IN (SELECT token FROM pairing_state)'
+        )
+        conn.execute('DELETE FROM pairing_code WHERE expires <= ?', (now,))
+
+    def stats(self):
+        codes = self._conn().execute(
+            'SELECT COUNT(*) FROM pairing_code WHERE expires > ?', (self._clock(),)
+        ).fetchone()[0]
+        return {
+            'entries': len(self),
+            'codes': codes,
+            'max_entries': self.max_entries,
+            'ttl': self.ttl,
+            'queue_size': self.queue_size,
+            'expired': self.expired,
+            'evicted': self.evicted,
+        }
+
+
+# ==================== HELPERS ====================
+PAIRING_CODE_BYTES = 9  # 72 random bits, 12 URL-safe characters
+
+
+def new_pairing_code():
+    return secrets.token_urlsafe(PAIRING_CODE_BYTES)
+
+
+def empty_snapshot():
+    return {
+        'version': 0,
+        'ready': False,
+        'seq': 0,
+        'acked': 0,
+        'pending': 0,
+        'directions': [],
+        'finished': None,
+    }
+
+
+# ==================== BACKEND SELECTION ====================
+def create_pairing_store(config):
+    backend = config.get('PAIRING_BACKEND', 'memory')
+    options = {
+        'max_entries': config['PAIRING_MAX_ENTRIES'],
+        'ttl': config['PAIRING_TTL_SECONDS'],
+        'queue_size': config['PAIRING_QUEUE_SIZE'],
+        'code_ttl': config['PAIRING_CODE_TTL_SECONDS'],
+    }
+    if backend == 'memory':
+        return PairingStateStore(**options)
+    if backend == 'sqlite':
+        return SQLitePairingStateStore(config['PAIRING_SQLITE_PATH'], **options)
+    raise ValueError(f"Unknown PAIRING_BACKEND: {backend!r}")
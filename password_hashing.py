@@ -0,0 +1,100 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+
+class HashingBusy(Exception):
+    """Raised when the hashing pool is saturated or does not answer in time."""
+
+
+# ==================== PASSWORD HASHER ====================
+class PasswordHasher:
+    """Hashes and verifies passwords in a small dedicated process pool.
+
+    ``method`` is any Werkzeug method string (``scrypt``, ``scrypt:16384:8:1``,
+    ``pbkdf2:sha256:600000`` ...). At most ``max_pending`` operations may be
+    queued or running at once; beyond that, and on timeouts, ``HashingBusy``
+    is raised instead of tying up the request thread. ``workers=0`` hashes
+    inline in the calling thread.
+    """
+
+    def __init__(self, method='scrypt', workers=2, max_pending=32, timeout=10.0):
+        self.method = method
+        self.workers = workers
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pid = None
+        self._pending = 0
+        self._prefix = None
+        self.rejected = 0
+
+    def _pool(self):
+        # spawn keeps the workers free of the web process's threads and
+        # open database handles; recreated after a fork of the parent.
+        if self._executor is None or self._pid != os.getpid():
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=multiprocessing.get_context('spawn')
+            )
+            self._pid = os.getpid()
+        return self._executor
+
+    def _run(self, fn, *args):
+        if not self.workers:
+            return fn(*args)
+        with self._lock:
+            if self._pending >= self.max_pending:
+                self.rejected += 1
+                raise HashingBusy('Too many password operations in flight')
+            self._pending += 1
+            pool = self._pool()
+        try:
+            future = pool.submit(fn, *args)
+        except Exception:
+            self._release()
+            raise
+        # A slot is held until the job leaves the pool, not until the caller
+        # gives up on it, so timeouts cannot grow a hidden backlog
+        future.add_done_callback(self._release)
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeout:
+            future.cancel()  # no-op if a worker already picked it up
+            raise HashingBusy('Password operation timed out') from None
+
+    def _release(self, future=None):
+        with self._lock:
+            self._pending -= 1
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password, self.method)
+
+    def verify(self, password_hash, password):
+        return self._run(check_password_hash, password_hash, password)
+
+    def needs_rehash(self, password_hash):
+        """True when ``password_hash`` was made with a different method or cost."""
+        if self._prefix is None:
+            # Werkzeug fills in default parameters for short method names,
+            # so learn the full prefix from one hash made under the policy.
+            self._prefix = self.hash('').split('$', 1)[0]
+        return password_hash.split('$', 1)[0] != self._prefix
+
+    def close(self):
+        with self._lock:
+            if self._executor is not None and self._pid == os.getpid():
+                self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def stats(self):
+        return {
+            'method': self.method,
+            'workers': self.workers,
+            'pending': self._pending,
+            'max_pending': self.max_pending,
+            'rejected': self.rejected,
+        }
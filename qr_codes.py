@@ -0,0 +1,84 @@
+import struct
+import zlib
+
+
+# qrcode (and the imaging stack behind it) is imported on the first render,
+# not at startup; levels map to qrcode.constants.ERROR_CORRECT_<level>.
+ERROR_CORRECTION = ('L', 'M', 'Q', 'H')
+MIMETYPES = {
+    'png': 'image/png',
+    'svg': 'image/svg+xml',
+}
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+PNG_PALETTE = b'\x00\x00\x00\xff\xff\xff'  # index 0 = dark module, 1 = light
+
+
+# ==================== QR MATRIX ====================
+def qr_matrix(data, error_correction='M', border=4):
+    import qrcode
+    from qrcode import constants
+
+    level = getattr(constants, f'ERROR_CORRECT_{error_correction}')
+    qr = qrcode.QRCode(error_correction=level, border=border)
+    qr.add_data(data)
+    qr.make(fit=True)
+    return qr.get_matrix()
+
+
+# ==================== ENCODERS ====================
+def _png_chunk(kind, payload):
+    return (
+        struct.pack('>I', len(payload)) + kind + payload
+        + struct.pack('>I', zlib.crc32(kind + payload))
+    )
+
+
+def render_png(matrix, box_size):
+    # 1-bit palette PNG written directly from the module matrix, which is
+    # both smaller and faster than going through a full PIL image.
+    size = len(matrix) * box_size
+    row_bytes = (size + 7) // 8
+    scanlines = []
+    for row in matrix:
+        bits = ''.join(('0' if dark else '1') * box_size for dark in row)
+        line = b'\x00' + int(bits.ljust(row_bytes * 8, '1'), 2).to_bytes(row_bytes, 'big')
+        scanlines.extend([line] * box_size)
+
+    header = struct.pack('>IIBBBBB', size, size, 1, 3, 0, 0, 0)
+    return b''.join((
+        PNG_SIGNATURE,
+        _png_chunk(b'IHDR', header),
+        _png_chunk(b'PLTE', PNG_PALETTE),
+        _png_chunk(b'IDAT', zlib.compress(b''.join(scanlines), 9)),
+        _png_chunk(b'IEND', b''),
+    ))
+
+
+def render_svg(matrix):
+    # One path segment per horizontal run of dark modules, in module units;
+    # the browser scales the viewBox to whatever size the <img> asks for.
+    segments = []
+    for y, row in enumerate(matrix):
+        x, width = 0, len(row)
+        while x < width:
+            if row[x]:
+                start = x
+                while x < width and row[x]:
+                    x += 1
+                segments.append(f'M{start} {y}h{x - start}v1H{start}z')
+            else:
+                x += 1
+    size = len(matrix)
+    return (
+        f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 {size} {size}" '
+        f'shape-rendering="crispEdges"><rect width="100%" height="100%" fill="#fff"/>'
+        f'<path d="{"".join(segments)}"/></svg>'
+    ).encode()
+
+
+def render_qr(data, fmt='png', error_correction='M', border=4, box_size=6):
+    matrix = qr_matrix(data, error_correction, border)
+    if fmt == 'svg':
+        return render_svg(matrix)
+    return render_png(matrix, box_size)
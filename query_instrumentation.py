@@ -0,0 +1,98 @@
+import logging
+import time
+from collections import Counter
+
+from flask import before_render_template, g, has_request_context, request, template_rendered
+from sqlalchemy import event
+
+
+logger = logging.getLogger(__name__)
+
+
+# ==================== PARAMETER SHAPES ====================
+def parameter_shape(parameters):
+    """Types of the bound parameters, never their values (they may be secrets)."""
+    if isinstance(parameters, dict):
+        return {key: type(value).__name__ for key, value in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        if parameters and isinstance(parameters[0], (list, tuple, dict)):
+            return f'{len(parameters)} x {parameter_shape(parameters[0])}'
+        return [type(value).__name__ for value in parameters]
+    return type(parameters).__name__
+
+
+# ==================== INSTRUMENTATION ====================
+def install_query_instrumentation(app, engine):
+    """Count queries and DB/render time per request.
+
+    Statements slower than SQL_SLOW_QUERY_MS are logged with their parameter
+    shapes. In debug mode, or with SQL_N_PLUS_ONE_WARN, a SELECT repeated
+    SQL_N_PLUS_ONE_THRESHOLD times in one request is logged as a likely N+1.
+    With SERVER_TIMING_ENABLED, responses carry a Server-Timing header with
+    db, render and total durations.
+    """
+    config = app.config
+
+    # The start time lives on the statement's execution context, so a
+    # statement that raises (and never reaches after_cursor_execute) leaves
+    # nothing behind on the pooled connection
+    @event.listens_for(engine, 'before_cursor_execute')
+    def start_query(conn, cursor, statement, parameters, context, executemany):
+        context._query_started = time.perf_counter()
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def end_query(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - context._query_started
+        if elapsed * 1000 >= config['SQL_SLOW_QUERY_MS']:
+            logger.warning(
+                'Slow query (%.1f ms): %s params=%s',
+                elapsed * 1000, ' '.join(statement.split()), parameter_shape(parameters)
+            )
+        # The batched result writer runs outside any request
+        if has_request_context() and 'sql_count' in g:
+            g.sql_count += 1
+            g.sql_seconds += elapsed
+            if statement.lstrip()[:6].upper() == 'SELECT':
+                g.sql_selects[statement] += 1
+
+    @before_render_template.connect_via(app)
+    def start_render(sender, template, context, **extra):
+        if 'render_seconds' in g:
+            g.render_started.append(time.perf_counter())
+
+    @template_rendered.connect_via(app)
+    def end_render(sender, template, context, **extra):
+        if 'render_seconds' in g and g.render_started:
+            started = g.render_started.pop()
+            # Nested renders are already part of the outer one
+            if not g.render_started:
+                g.render_seconds += time.perf_counter() - started
+
+    @app.before_request
+    def start_request_timing():
+        g.request_started = time.perf_counter()
+        g.sql_count = 0
+        g.sql_seconds = 0.0
+        g.sql_selects = Counter()
+        g.render_seconds = 0.0
+        g.render_started = []
+
+    @app.after_request
+    def report_request_timing(response):
+        if 'sql_count' not in g:
+            return response
+        if app.debug or config['SQL_N_PLUS_ONE_WARN']:
+            for statement, count in g.sql_selects.items():
+                if count >= config['SQL_N_PLUS_ONE_THRESHOLD']:
+                    logger.warning(
+                        'Possible N+1 on %s: %d identical queries: %s',
+                        request.endpoint or request.path, count, ' '.join(statement.split())
+                    )
+        if config['SERVER_TIMING_ENABLED']:
+            total = time.perf_counter() - g.request_started
+            response.headers['Server-Timing'] = (
+                f'db;dur={g.sql_seconds * 1000:.1f};desc="{g.sql_count} queries", '
+                f'render;dur={g.render_seconds * 1000:.1f}, '
+                f'total;dur={total * 1000:.1f}'
+            )
+        return response
@@ -0,0 +1,135 @@
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+# ==================== WRITE-BEHIND QUEUE ====================
+class ResultWriteQueue:
+    """Bounded write-behind queue that hands items to ``write_batch`` in groups.
+
+    A background thread collects up to ``batch_size`` items, or whatever has
+    arrived within ``flush_interval`` seconds of the first one, and writes
+    them with a single call (one commit). ``submit`` returns a Future that
+    resolves once the item's batch is committed, or None when the queue is
+    full so the caller can write synchronously instead.
+    """
+
+    def __init__(self, write_batch, max_size=1024, batch_size=64, flush_interval=0.02):
+        self._write_batch = write_batch
+        self.max_size = max_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._queue = None
+        self._thread = None
+        self._pid = None
+        self._closed = False
+        self.batches = 0
+        self.written = 0
+        self.failed = 0
+        self.rejected = 0
+
+    def _ensure_worker(self):
+        # Started lazily and restarted after a fork, since threads do not
+        # survive into preforked worker processes.
+        with self._lock:
+            if self._thread is None or self._pid != os.getpid():
+                self._queue = queue.Queue(self.max_size)
+                self._pid = os.getpid()
+                self._thread = threading.Thread(
+                    target=self._run, name='result-writer', daemon=True
+                )
+                self._thread.start()
+            return self._queue
+
+    def submit(self, item):
+        if self._closed:
+            raise RuntimeError('Result write queue is closed')
+        future = Future()
+        try:
+            self._ensure_worker().put_nowait((item, future))
+        except queue.Full:
+            self.rejected += 1
+            return None
+        return future
+
+    def flush(self):
+        """Block until everything submitted so far has been written."""
+        if self._queue is not None and self._pid == os.getpid():
+            self._queue.join()
+
+    def close(self):
+        """Write out everything still queued and stop the worker."""
+        with self._lock:
+            self._closed = True
+            thread, pending = self._thread, self._queue
+            if thread is None or self._pid != os.getpid():
+                return
+        pending.put(_STOP)
+        thread.join()
+
+    def stats(self):
+        return {
+            'queued': self._queue.qsize() if self._queue is not None else 0,
+            'max_size': self.max_size,
+            'batch_size': self.batch_size,
+            'batches': self.batches,
+            'written': self.written,
+            'failed': self.failed,
+            'rejected': self.rejected,
+        }
+
+    # -------------------- worker --------------------
+    def _run(self):
+        pending = self._queue
+        stopping = False
+        while not stopping:
+            first = pending.get()
+            if first is _STOP:
+                pending.task_done()
+                break
+            batch = [first]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    entry = pending.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if entry is _STOP:
+                    pending.task_done()
+                    stopping = True
+                    break
+                batch.append(entry)
+            self._write(batch)
+            for _ in batch:
+                pending.task_done()
+
+    def _write(self, batch):
+        self.batches += 1
+        try:
+            self._write_batch([item for item, _ in batch])
+        except Exception:
+            if len(batch) == 1:
+                item, future = batch[0]
+                logger.exception('Failed to write queued result %r', item)
+                self.failed += 1
+                future.set_exception(RuntimeError('Result could not be saved'))
+                return
+            # Retry one by one so a single bad row does not take the batch down
+            for entry in batch:
+                self._write([entry])
+            return
+        self.written += len(batch)
+        for _, future in batch:
+            future.set_result(True)